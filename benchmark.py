@@ -0,0 +1,320 @@
+# benchmarks for the board hot paths and whole games, so we can tell
+# whether a change to an engine actually helps
+#
+# python benchmark.py                    run and print the timings
+# python benchmark.py --save [FILE]      ...and save them as a baseline
+# python benchmark.py --compare [FILE]   ...and flag anything slower than
+#                                        the baseline by more than
+#                                        --threshold (default 10%)
+#
+# FILE defaults to benchmark_baseline.json next to this file, which holds
+# a full run from when the benchmarks were written.  Timings depend on the
+# machine, so save your own baseline before comparing.  A --quick run times
+# less work per benchmark than a full one, so only compare like with like.
+#
+# Every timing is in seconds per call (per turn, or per game, for the
+# game benchmarks, which are played with lists of moves, with packed moves
+# and with moveIndexes), so lower is better.  Boards and games are seeded, so
+# two runs time exactly the same work.
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from jewels import (board, engines, randomChooser, chooseFromHighest,
+                    chooseTop1, chooseBottom1, chooseFromTop3)
+
+
+# (width, height, numberOfColours, vanishLength): the rockbox game, larger
+# boards, then other colour counts and mono lengths on the 8x8 board
+cases = ([(n, n, 7, 3) for n in (8, 16, 32, 64)] +
+         [(8, 8, c, 3) for c in (5, 6, 8, 9)] +
+         [(8, 8, 7, 4)])
+
+# the tiled engine only pays for its workers on large boards, so it's only
+# timed on boards of at least this many cells, and only per operation:
+# each game would start its own workers
+tiledCells = 64 * 64
+
+baselineFile = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "benchmark_baseline.json")
+
+choosers = [randomChooser, chooseFromHighest, chooseTop1, chooseBottom1,
+            chooseFromTop3]
+
+# how the game benchmarks pass moves to the chooser: (name suffix, packed,
+# indexed)
+variants = [("", False, False), (" packed", True, False),
+            (" indexed", False, True)]
+
+
+def caseName(case):
+    width, height, numberOfColours, vanishLength = case
+    return (str(width) + "x" + str(height) + " c" + str(numberOfColours) +
+            " v" + str(vanishLength))
+
+
+def boards(case, engine, number, seed):
+    # number randomized boards, each with its own seeded rng
+    width, height, numberOfColours, vanishLength = case
+    bs = []
+    for k in range(number):
+        b = board(width, height, numberOfColours, vanishLength, engine=engine,
+                  rng=random.Random(seed * 1000 + k))
+        b.randomize()
+        bs.append(b)
+    return bs
+
+
+def settled(case, engine, number, seed):
+    # boards with their starting monos evolved away
+    bs = boards(case, engine, number, seed)
+    for b in bs:
+        b.evolve()
+    return bs
+
+
+def holed(case, engine, number, seed):
+    # settled boards with the monos of a random legal move zeroed out, as
+    # they would be just before gravity
+    bs = []
+    for b in settled(case, engine, number, seed):
+        moves, n = b.legitMoves()
+        if n == 0:
+            continue
+        b.applyMove(b.rng.choice(moves))
+        for m in b.findMonos():
+            for x in m:
+                b.entries[x[0]][x[1]] = 0
+        bs.append(b)
+    return bs
+
+
+def fallen(case, engine, number, seed):
+    # holed boards after gravity, ready to be refilled
+    bs = holed(case, engine, number, seed)
+    for b in bs:
+        b.gravity()
+    return bs
+
+
+def timeEach(bs, op, repeats, engine):
+    # the best over repeats of the mean time of op(b) over bs on engine.
+    # op may change the boards, so each call is on a fresh copy, loaded
+    # into one scratch board outside the timing (so a tiled board starts
+    # its workers once, before we time anything).
+    b = bs[0]
+    c = board(b.width, b.height, b.numberOfColours, b.vanishLength,
+              engine=engine)
+    try:
+        load(c, b, 0)
+        c.legitMoves()
+        best = None
+        for r in range(repeats):
+            t = 0.0
+            for b in bs:
+                load(c, b, r)
+                start = time.time()
+                op(c)
+                t += time.time() - start
+            t /= len(bs)
+            if best is None or t < best:
+                best = t
+        return best
+    finally:
+        c.close()
+
+
+def load(c, b, seed):
+    # make c a copy of b with a fresh score and rng.  Row by row, as a
+    # tiled board's rows are views of its grid.
+    for i in range(b.height):
+        c.entries[i][:] = b.entries[i]
+    c.score = 0
+    c.numberOfTurns = 0
+    c.rng = random.Random(seed)
+    c.invalidateMoves()
+
+
+def enginesFor(case):
+    width, height, numberOfColours, vanishLength = case
+    return [e for e in sorted(engines)
+            if e != "tiled" or width * height >= tiledCells]
+
+
+def findMonos(b):
+    b.findMonos()
+
+
+def legitMoves(b):
+    # a full scan, as after a fresh board
+    b.invalidateMoves()
+    b.legitMoves()
+
+
+def evolve(b):
+    b.evolve()
+
+
+def gravity(b):
+    b.gravity()
+
+
+def randomFillZeroes(b):
+    b.randomFillZeroes()
+
+
+def playGames(case, engine, chooser, number, maxTurns, seed, repeats,
+              packed=False, indexed=False):
+    # play number games of at most maxTurns turns each, as playGame would
+    # (with packed moves if packed is True, and a moveIndex if indexed is),
+    # and return the best over repeats of the seconds per game and per turn
+    best = None
+    for r in range(repeats):
+        t = timeGames(case, engine, chooser, number, maxTurns, seed, packed,
+                      indexed)
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def timeGames(case, engine, chooser, number, maxTurns, seed, packed,
+              indexed):
+    width, height, numberOfColours, vanishLength = case
+    turns = 0
+    start = time.time()
+    for k in range(number):
+        random.seed(seed * 1000 + k)
+        b = board(width, height, numberOfColours, vanishLength, engine=engine,
+                  rng=random.Random(seed * 1000 + k))
+        b.randomize()
+        while b.numberOfTurns < maxTurns:
+            b.evolve()
+            if indexed:
+                index = b.moveIndex(packed)
+                if len(index) == 0:
+                    break
+                move = chooser(index)
+                if packed:
+                    b.applyMoveCode(move)
+                else:
+                    b.applyMove(move)
+            elif packed:
+                codes = b.legitMoveCodes()
+                if len(codes) == 0:
+                    break
+                b.applyMoveCode(chooser(codes))
+            else:
+                moves, n = b.legitMoves()
+                if n == 0:
+                    break
+                b.applyMove(chooser(moves))
+            b.numberOfTurns += 1
+        turns += b.numberOfTurns
+    seconds = time.time() - start
+    return seconds / number, seconds / max(turns, 1)
+
+
+def run(quick=False, seed=0):
+    # return a dict mapping benchmark names to seconds per call, printing
+    # each one as it finishes
+    number = 20 if quick else 100
+    repeats = 3 if quick else 5
+    games = 3 if quick else 10
+    maxTurns = 200 if quick else 1000
+    results = {}
+
+    def record(name, seconds):
+        results[name] = seconds
+        print("%-48s %12.2f us" % (name, seconds * 1e6))
+        sys.stdout.flush()
+
+    for case in cases:
+        for engine in enginesFor(case):
+            prefix = engine + " " + caseName(case) + " "
+            # the boards to copy; the engines play the same games, so a
+            # tiled board's can come from the list engine
+            source = "list" if engine == "tiled" else engine
+            bs = boards(case, source, number, seed)
+            record(prefix + "findMonos", timeEach(bs, findMonos, repeats, engine))
+            record(prefix + "evolve", timeEach(bs, evolve, repeats, engine))
+            bs = settled(case, source, number, seed)
+            record(prefix + "legitMoves", timeEach(bs, legitMoves, repeats, engine))
+            bs = holed(case, source, number, seed)
+            if bs:
+                record(prefix + "gravity", timeEach(bs, gravity, repeats, engine))
+                bs = fallen(case, source, number, seed)
+                record(prefix + "randomFillZeroes",
+                       timeEach(bs, randomFillZeroes, repeats,
+                                engine))
+            if engine == "tiled":
+                continue
+            for chooser in choosers:
+                for suffix, packed, indexed in variants:
+                    name = prefix + chooser.__name__ + suffix
+                    perGame, perTurn = playGames(case, engine, chooser, games,
+                                                 maxTurns, seed, repeats,
+                                                 packed, indexed)
+                    record(name + " game", perGame)
+                    record(name + " turn", perTurn)
+    return results
+
+
+def compare(results, baseline, threshold):
+    # print how each benchmark moved against the baseline, and return the
+    # names of those more than threshold (a fraction) slower
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline or not baseline[name]:
+            continue
+        ratio = results[name] / baseline[name]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print("%-48s %8.2fx%s" % (name, ratio, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmark jewels.py")
+    parser.add_argument("--save", metavar="FILE", nargs="?",
+                        const=baselineFile,
+                        help="save the timings to FILE as a baseline")
+    parser.add_argument("--compare", metavar="FILE", nargs="?",
+                        const=baselineFile,
+                        help="compare the timings with the baseline in FILE")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="slowdown counted as a regression (default 0.1)")
+    parser.add_argument("--quick", action="store_true",
+                        help="fewer boards, games and repeats")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if (baseline["quick"], baseline["seed"]) != (args.quick, args.seed):
+            parser.error("the baseline was saved with quick=" +
+                         str(baseline["quick"]) + ", seed=" +
+                         str(baseline["seed"]))
+    results = run(args.quick, args.seed)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"quick": args.quick, "seed": args.seed,
+                       "timings": results}, f, indent=1, sort_keys=True)
+    if args.compare:
+        print("")
+        regressions = compare(results, baseline["timings"], args.threshold)
+        if regressions:
+            print(str(len(regressions)) + " regressions")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
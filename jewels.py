@@ -2,20 +2,218 @@
 # various strategies
 
 import random
-from matplotlib import pyplot as plt
-import scipy.stats as stat
-from collections import Counter, defaultdict
-import pickle
+from array import array
+from collections import Counter, defaultdict, namedtuple, OrderedDict
 import os
+import hashlib
+import inspect
+import pickle
+import importlib
+import itertools
+import json
+import multiprocessing
+import argparse
+import time
 from datetime import datetime
 
 
+class lazyModule(object):
+    # stands in for a module, importing it the first time one of its
+    # attributes is used, so importing jewels doesn't pay for numpy, scipy
+    # and matplotlib until a batch run or a report needs them
+    def __init__(self, name):
+        self.name = name
+        self.module = None
+
+    def __getattr__(self, attr):
+        if self.module is None:
+            self.module = importlib.import_module(self.name)
+        return getattr(self.module, attr)
+
+
+np = lazyModule("numpy")
+stat = lazyModule("scipy.stats")
+plt = lazyModule("matplotlib.pyplot")
+
+
+zobristTables = {}
+
+
+def zobristTable(numberOfCells, numberOfColours):
+    # random 64 bit keys, one per (cell, colour), for Zobrist hashing: the
+    # hash of a board is the XOR of the keys of its cells' colours.  Fixed
+    # per board shape, so hashes can be compared between boards and games.
+    key = (numberOfCells, numberOfColours)
+    if key not in zobristTables:
+        r = random.Random(numberOfCells * 1000 + numberOfColours)
+        zobristTables[key] = [[r.getrandbits(64) for c in range(numberOfColours + 1)]
+                              for k in range(numberOfCells)]
+    return zobristTables[key]
+
+
+class colourStream(object):
+    # A counter-based random stream for a board's rng.  Block n of the
+    # stream with a given key is the SHA-512 digest of the key and n: 64
+    # random bytes, each drawn as a colour (by rejection, so every colour
+    # is equally likely).  So game k of a run, with key (run seed, k), gets
+    # the same colours wherever and whenever it's played, and a draw costs
+    # a byte lookup rather than a call to random.randint.
+    #
+    # It does what a board needs of random.Random: randint (for up to 256
+    # values), getstate, setstate and seed.
+    def __init__(self, *key):
+        self.seed(*key)
+
+    def seed(self, *key):
+        self.key = " ".join(map(str, key))
+        self.block = 0
+        self.newBlock()
+
+    def newBlock(self):
+        digest = hashlib.sha512(self.key + " " + str(self.block)).digest()
+        self.bytes = bytearray(digest)
+        self.position = 0
+
+    def randint(self, a, b):
+        n = b - a + 1
+        if n > 256:
+            raise ValueError("colourStream draws from at most 256 values")
+        limit = 256 - 256 % n
+        while True:
+            if self.position == 64:
+                self.block += 1
+                self.newBlock()
+            x = self.bytes[self.position]
+            self.position += 1
+            if x < limit:
+                return a + x % n
+
+    def getstate(self):
+        return self.key, self.block, self.position
+
+    def setstate(self, state):
+        key, block, position = state
+        if (key, block) != (self.key, self.block):
+            self.key = key
+            self.block = block
+            self.newBlock()
+        self.position = position
+
+
+def encodeMove(move, width):
+    # a move [[i, j], [k, l]] as one int: (i * width + j) * 2, plus 1 if it
+    # swaps with the entry below rather than the one to the right
+    i, j = move[0]
+    return (i * width + j) * 2 + (move[1][0] - i)
+
+
+def decodeMove(code, width):
+    # the move encodeMove(move, width) came from
+    cell, d = divmod(code, 2)
+    i, j = divmod(cell, width)
+    if d == 0:
+        return [[i, j], [i, j + 1]]
+    return [[i, j], [i + 1, j]]
+
+
+class moveCodes(array):
+    # A packed list of moves: an array of encodeMove ints, in the same
+    # (row) order as the lists legitMoves gives, which knows the width of
+    # its board so choosers can find each move's row (code // (2 * width)).
+    # See board.legitMoveCodes and testStrategy(..., packed=True).
+    def __new__(cls, width, codes=()):
+        self = array.__new__(cls, "i", codes)
+        self.width = width
+        return self
+
+
+class moveIndex(object):
+    # The legal moves of a board, as from legitMoves (or legitMoveCodes if
+    # packed) and so in row order, bucketed by row: rows[i] holds the moves
+    # whose first cell is in row i.  It works out once, while bucketing, what the
+    # choosers and playGame keep asking: the highest and lowest rows with
+    # moves and the mean height of the moves.  It also acts as the list of
+    # moves itself, so any chooser can take one.
+    #
+    # annotation(n) gives the lengths of the monos the nth move makes and
+    # the points they score, before any chain reaction; these are only
+    # worked out when asked for.  Like the lists from legitMoves, an index
+    # is only good until the board changes.
+    def __init__(self, b, packed=False):
+        self.board = b
+        self.packed = packed
+        if packed:
+            self.moves = b.legitMoveCodes()
+            rowLength = 2 * b.width
+        else:
+            self.moves = b.legitMoves()[0]
+        self.rows = [[] for i in range(b.height)]
+        total = 0
+        for m in self.moves:
+            r = m // rowLength if packed else m[0][0]
+            self.rows[r].append(m)
+            total += r
+        if self.moves:
+            self.meanHeight = total / (1.0 * len(self.moves))
+            r = self.rowOf(0)
+            self.highestRow = r
+            self.lowestRow = self.rowOf(len(self.moves) - 1)
+        else:
+            self.meanHeight = None
+            self.highestRow = None
+            self.lowestRow = None
+        self.annotations = {}
+
+    def __len__(self):
+        return len(self.moves)
+
+    def __getitem__(self, n):
+        return self.moves[n]
+
+    def __iter__(self):
+        return iter(self.moves)
+
+    def rowOf(self, n):
+        m = self.moves[n]
+        return m // (2 * self.board.width) if self.packed else m[0][0]
+
+    def annotation(self, n):
+        # (lengths of the monos made, points scored) for the nth move
+        if n not in self.annotations:
+            m = self.moves[n]
+            if self.packed:
+                m = decodeMove(m, self.board.width)
+            lengths = self.board.monosMade(m[0][0], m[0][1], m[1][0], m[1][1])
+            gain = sum(l - self.board.vanishLength + 1 for l in lengths)
+            self.annotations[n] = (lengths, gain)
+        return self.annotations[n]
+
+    def gains(self):
+        # the points each move scores before any chain reaction, in order
+        return [self.annotation(n)[1] for n in range(len(self.moves))]
+
+
 class board(object):
-    def __init__(self, width=8, height=8, numberOfColours=7, vanishLength=3):
+    def __new__(cls, width=8, height=8, numberOfColours=7, vanishLength=3,
+                engine="list", rng=None, **options):
+        # board(..., engine="bitboard") gives a bitboard instead, which plays
+        # the same game but finds monos and moves using bitmasks, and
+        # engine="tiled" a tiledBoard; options go to the engine
+        if cls is board and engine != "list":
+            if engine not in engines:
+                raise ValueError("unknown engine " + str(engine))
+            cls = engines[engine]
+        return object.__new__(cls)
+
+    def __init__(self, width=8, height=8, numberOfColours=7, vanishLength=3,
+                 engine="list", rng=None):
         # The rockbox jewels game has width=height=8, numberOfColours=7,
         # vanishLength = 3
         # Coloured blocks are represented by 1, 2, ..., numberOfColours
         # 0 represents an empty space
+        # New blocks are drawn using rng.randint, where rng is a
+        # random.Random or by default the random module itself.
+        self.rng = random if rng is None else rng
         self.width = width
         self.height = height
         self.numberOfColours = numberOfColours
@@ -24,6 +222,28 @@ class board(object):
         self.score = 0
         self.entries = [[0 for i in range(self.width)] for j in range(self.height)]
         self.numberOfTurns = 0
+        # legitMoves keeps the set of legal moves between calls and only
+        # rechecks the moves near cells whose colour has changed since the
+        # last call. A move is stored as a triple (i, j, d): d == 0 means
+        # swap [i,j] with [i,j+1], d == 1 means swap [i,j] with [i+1,j].
+        # If you write to self.entries directly, call invalidateMoves().
+        self.legalMoves = set()
+        self.moveList = []
+        self.moveCodes = None
+        self.dirtyCells = set()
+        self.allDirty = True
+        # Similarly evolve only looks for monos in the rows and columns of
+        # cells which changed since it last ran (the board had no monos
+        # then, so any new mono must contain one of them).
+        self.unsettledCells = set()
+        self.allUnsettled = True
+        # pushMove/popMove: while journal is a list, applyMove and evolve
+        # append (row, col, old colour) to it for every cell they change
+        self.journal = None
+        self.moveStack = []
+        # the Zobrist hash of self.entries, or None if it needs working out
+        # again, see zobrist()
+        self.zobristHash = None
 
     # the nump branch in github shows what happens if you store the entries
     # in a numpy array of ints - it's slower by a factor of nearly 2
@@ -35,19 +255,53 @@ class board(object):
     def randomize(self):
         for i in range(self.width):
             for j in range(self.height):
-                self.entries[j][i] = random.randint(1, self.numberOfColours)
+                self.entries[j][i] = self.rng.randint(1, self.numberOfColours)
+        self.allDirty = True
+        self.allUnsettled = True
+        self.zobristHash = None
+
+    def invalidateMoves(self):
+        # forget the cached legal moves and make evolve look at the whole
+        # board, e.g. after editing self.entries by hand
+        self.allDirty = True
+        self.allUnsettled = True
+        self.zobristHash = None
+
+    def close(self):
+        # release anything the board holds outside itself; nothing, but a
+        # tiledBoard has worker processes
+        pass
+
+    def zobrist(self):
+        # a 64 bit hash of self.entries.  pushMove and popMove keep it up to
+        # date from the cells they change; anything else makes us start again
+        if self.zobristHash is None:
+            table = zobristTable(self.width * self.height, self.numberOfColours)
+            h = 0
+            k = 0
+            for row in self.entries:
+                for colour in row:
+                    h ^= table[k][colour]
+                    k += 1
+            self.zobristHash = h
+        return self.zobristHash
 
     def findMonos(self):
         # return a list whose elements correspond to the maximal monos
         # in the current board.
         # Each list element is a list of coordinates
         # making up the corresponding mono
+        return self.monosIn(range(self.height), range(self.width))
+
+    def monosIn(self, rows, cols):
+        # the maximal horizontal monos in the given rows followed by the
+        # maximal vertical monos in the given columns, as for findMonos
         # if we stored the board as a numpy matrix we could extract the
         # rows or columns as vectors and so avoid writing all this stuff
         # twice...(but it turns out to be a lot slower in numpy)
         output = []
         # first, the horizontal monos
-        for i in range(self.height):
+        for i in rows:
             row = self.entries[i]
             currentColour = row[0]
             currentStreakStart = 0
@@ -64,7 +318,7 @@ class board(object):
                 output.append([[i, x] for x in
                                range(currentStreakStart, self.width)])
         # now the vertical monos
-        for j in range(self.width):
+        for j in cols:
             currentColour = self.entries[0][j]
             currentStreakStart = 0
             for i in range(1, self.height):
@@ -83,19 +337,28 @@ class board(object):
         return output
 
     def gravity(self):
+        self.zobristHash = None
         for j in range(self.width):
             col = [self.entries[i][j] for i in
                    range(self.height) if self.entries[i][j] != 0]
+            if len(col) == self.height:
+                continue  # no holes in this column
             newcol = [0 for x in range(self.height - len(col))] + col
             # make the first col equal to newcol
             for i in range(self.height):
-                self.entries[i][j] = newcol[i]
+                if self.entries[i][j] != newcol[i]:
+                    self.entries[i][j] = newcol[i]
+                    self.dirtyCells.add((i, j))
+                    self.unsettledCells.add((i, j))
 
     def randomFillZeroes(self):
+        self.zobristHash = None
         for i in range(self.height):
             for j in range(self.width):
                 if self.entries[i][j] == 0:
-                    self.entries[i][j] = random.randint(1, self.numberOfColours)
+                    self.entries[i][j] = self.rng.randint(1, self.numberOfColours)
+                    self.dirtyCells.add((i, j))
+                    self.unsettledCells.add((i, j))
 
     def evolve(self):
         # repeat:
@@ -105,17 +368,69 @@ class board(object):
         #   random fill any spaces
         # until there are no more monos.
         # return the number of chain reactions caused
+        #
+        # This does what findMonos, gravity and randomFillZeroes would, but
+        # only looks at the part of the board which changed: monos are
+        # looked for in the rows and columns of the changed cells, and only
+        # the columns with holes are compacted and refilled.  Refills are
+        # drawn in the same (row by row) order as randomFillZeroes, so the
+        # game is exactly the same.
+        if self.allUnsettled:
+            rows = range(self.height)
+            cols = range(self.width)
+        else:
+            rows = sorted(set(x[0] for x in self.unsettledCells))
+            cols = sorted(set(x[1] for x in self.unsettledCells))
+        self.allUnsettled = False
+        self.unsettledCells = set()
+        self.zobristHash = None
+        e = self.entries
+        journal = self.journal
         chains = -1
-        while self.findMonos(): # i.e. while it is nonempty
+        while True:
+            monos = self.monosIn(rows, cols)
+            if not monos:
+                return chains
             chains += 1
-            monos = self.findMonos()
+            lowestHole = {}  # column -> lowest row emptied in it
             for m in monos:
                 self.score += len(m) - self.vanishLength + 1
                 for x in m:
-                    self.entries[x[0]][x[1]] = 0
-            self.gravity()
-            self.randomFillZeroes()
-        return chains
+                    if journal is not None:
+                        journal.append((x[0], x[1], e[x[0]][x[1]]))
+                    e[x[0]][x[1]] = 0
+                    if lowestHole.get(x[1], -1) < x[0]:
+                        lowestHole[x[1]] = x[0]
+            cols = sorted(lowestHole)
+            holes = self.dropColumns(lowestHole)
+            for i in range(max(holes.values())):
+                for j in cols:
+                    if i < holes[j]:
+                        if journal is not None:
+                            journal.append((i, j, 0))
+                        e[i][j] = self.rng.randint(1, self.numberOfColours)
+                        self.dirtyCells.add((i, j))
+            rows = range(max(lowestHole.values()) + 1)
+
+    def dropColumns(self, lowestHole):
+        # evolve's gravity: in each column j of lowestHole, drop the blocks
+        # above and including row lowestHole[j], and return a dict of the
+        # number of holes left at the top of each
+        e = self.entries
+        journal = self.journal
+        holes = {}
+        for j in sorted(lowestHole):
+            low = lowestHole[j]
+            col = [e[i][j] for i in range(low + 1) if e[i][j] != 0]
+            holes[j] = low + 1 - len(col)
+            newcol = [0] * holes[j] + col
+            for i in range(low + 1):
+                if e[i][j] != newcol[i]:
+                    if journal is not None:
+                        journal.append((i, j, e[i][j]))
+                    e[i][j] = newcol[i]
+                    self.dirtyCells.add((i, j))
+        return holes
 
     def horizontalMonoContaining(self, coords):
         # does self.entries contain a horizontal mono containing the entry
@@ -157,58 +472,928 @@ class board(object):
                 u += 1
         return u + d - 1 >= self.vanishLength
 
+    def isLegit(self, i, j, d):
+        # does swapping [i,j] with its right neighbour (d == 0) or the entry
+        # below it (d == 1) create a new mono?
+        if d == 0:
+            k, l = i, j + 1
+        else:
+            k, l = i + 1, j
+        e = self.entries
+        if e[i][j] == e[k][l]:
+            return False
+        # copy.deepcopy is really slow, so we'll apply the move, test for
+        # monos, then apply it again to get back where we started.
+        # There can be four kinds of new mono: vertical or horizontal,
+        # containing [i,j] or [k,l]
+        e[i][j], e[k][l] = e[k][l], e[i][j]
+        legit = (self.verticalMonoContaining([k, l]) or
+                 self.verticalMonoContaining([i, j]) or
+                 self.horizontalMonoContaining([i, j]) or
+                 self.horizontalMonoContaining([k, l]))
+        e[i][j], e[k][l] = e[k][l], e[i][j]
+        return legit
+
+    def movesNear(self, cells):
+        # Whether a move is legit only depends on the entries within
+        # vanishLength - 1 of the two swapped cells in the same row or
+        # column.  Return the set of moves which could have changed
+        # legitimacy when the entries in cells changed.
+        reach = self.vanishLength - 1
+        touched = set()
+        for (r, c) in cells:
+            for a in range(max(0, r - reach), min(self.height, r + reach + 1)):
+                touched.add((a, c))
+            for b in range(max(0, c - reach), min(self.width, c + reach + 1)):
+                touched.add((r, b))
+        moves = set()
+        for (a, b) in touched:
+            if b < self.width - 1:
+                moves.add((a, b, 0))
+            if b > 0:
+                moves.add((a, b - 1, 0))
+            if a < self.height - 1:
+                moves.add((a, b, 1))
+            if a > 0:
+                moves.add((a - 1, b, 1))
+        return moves
+
+    def refreshMoves(self):
+        # Bring self.legalMoves up to date.  Only the moves near cells which
+        # changed since the last call are rechecked; a move plus its cascade
+        # usually only touches a few columns.  When most of the board
+        # changed we just check everything.  If anything was rechecked the
+        # move lists are made again when next asked for.
+        if (self.allDirty or
+                len(self.dirtyCells) * 4 > self.width * self.height):
+            self.legalMoves = set()
+            candidates = [(i, j, d) for i in range(self.height)
+                          for j in range(self.width) for d in (0, 1)
+                          if (d == 0 and j < self.width - 1) or
+                          (d == 1 and i < self.height - 1)]
+        elif self.dirtyCells:
+            candidates = self.movesNear(self.dirtyCells)
+        else:
+            return
+        for m in candidates:
+            if self.isLegit(m[0], m[1], m[2]):
+                self.legalMoves.add(m)
+            else:
+                self.legalMoves.discard(m)
+        self.allDirty = False
+        self.dirtyCells = set()
+        self.moveList = None
+        self.moveCodes = None
+
     def legitMoves(self):
         # Moves swap two entries which are adjacent horizontally or vertically.
         # A move is legit iff it creates a new mono.
         # This function returns a list of all legit moves, as a list of pairs
-        # of coordinates, and the number of legitimate moves.
-        numberLegitMoves = 0
-        listOfMoves = []
-        for i in range(self.height):
-            for j in range(self.width):
-                if (j < self.width - 1) and (self.entries[i][j] !=
-                   self.entries[i][j + 1]):
-                    # it makes sense to swap [i,j] and [i,j+1]. does that
-                    #  create a new mono?
-                    # copy.deepcopy is really slow, so we'll apply the move,
-                    #  test for monos, then apply it again to get back where we
-                    # started
-                    self.applyMove([[i, j], [i, j + 1]])
-                    # now look for monos. There can be four kinds:
-                    #  1. vert mono containing [i,j+1] of colour entries[i][j]
-                    #  2. vert mono containing [i,j] of colour entries[i][j+1]
-                    #  3. horiz mono finishing [i,j] of colour entries[i][j+1]
-                    #  4. horiz mono starting [i,j+1] of colour entries[i][j]
-                    if (self.verticalMonoContaining([i, j + 1]) or
-                            self.verticalMonoContaining([i, j]) or
-                            self.horizontalMonoContaining([i, j]) or
-                            self.horizontalMonoContaining([i, j + 1])):
-                        numberLegitMoves += 1
-                        listOfMoves.append([[i, j], [i, j + 1]])
-                    self.applyMove([[i, j], [i, j + 1]])  # get self.entries
-                    # back to where it was before
-                if ((i < self.height - 1) and
-                        (self.entries[i][j] != self.entries[i + 1][j])):
-                    # it makes sense to swap [i,j] and [i+1,j]. does that
-                    # create a new mono?
-                    self.applyMove([[i, j], [i + 1, j]])
-                    if (self.verticalMonoContaining([i, j]) or
-                            self.verticalMonoContaining([i + 1, j]) or
-                            self.horizontalMonoContaining([i, j]) or
-                            self.horizontalMonoContaining([i + 1, j])):
-                        numberLegitMoves += 1
-                        listOfMoves.append([[i, j], [i + 1, j]])
-                    self.applyMove([[i, j], [i + 1, j]])
-        return listOfMoves, numberLegitMoves
+        # of coordinates, and the number of legitimate moves.  The moves are
+        # listed in row order, and the list is shared between calls until the
+        # board changes, so don't modify it.
+        self.refreshMoves()
+        if self.moveList is None:
+            self.moveList = [[[i, j], [i, j + 1]] if d == 0 else [[i, j], [i + 1, j]]
+                             for (i, j, d) in sorted(self.legalMoves)]
+        return self.moveList, len(self.moveList)
+
+    def moveIndex(self, packed=False):
+        # the legal moves as a moveIndex
+        return moveIndex(self, packed)
+
+    def runThrough(self, i, j, di, dj):
+        # the length of the run of [i,j]'s colour through [i,j] along the
+        # direction (di, dj)
+        e = self.entries
+        colour = e[i][j]
+        n = 1
+        a, b = i + di, j + dj
+        while 0 <= a < self.height and 0 <= b < self.width and e[a][b] == colour:
+            n += 1
+            a, b = a + di, b + dj
+        a, b = i - di, j - dj
+        while 0 <= a < self.height and 0 <= b < self.width and e[a][b] == colour:
+            n += 1
+            a, b = a - di, b - dj
+        return n
+
+    def monosMade(self, i, j, k, l):
+        # the lengths of the monos swapping [i,j] with [k,l] would make, on
+        # a board with no monos.  The two cells end up different colours,
+        # so the (up to) four runs through them are different monos.
+        e = self.entries
+        e[i][j], e[k][l] = e[k][l], e[i][j]
+        lengths = []
+        for (a, b) in ((i, j), (k, l)):
+            for (di, dj) in ((0, 1), (1, 0)):
+                n = self.runThrough(a, b, di, dj)
+                if n >= self.vanishLength:
+                    lengths.append(n)
+        e[i][j], e[k][l] = e[k][l], e[i][j]
+        return lengths
+
+    def legitMoveCodes(self):
+        # the same moves as legitMoves, in the same order, packed into a
+        # moveCodes without making a list per move.  Shared between calls
+        # too, so don't modify it.
+        self.refreshMoves()
+        if self.moveCodes is None:
+            w = self.width
+            self.moveCodes = moveCodes(w, sorted([(i * w + j) * 2 + d
+                                                  for (i, j, d) in self.legalMoves]))
+        return self.moveCodes
+
+    def applyMoveCode(self, code):
+        # applyMove for a move packed by encodeMove
+        cell = code >> 1
+        d = code & 1
+        i = cell // self.width
+        j = cell - i * self.width
+        self.swap(i, j, i + d, j + 1 - d)
 
     def applyMove(self, move):
-        firstrow = move[0][0]
-        firstcol = move[0][1]
-        secondrow = move[1][0]
-        secondcol = move[1][1]
+        self.swap(move[0][0], move[0][1], move[1][0], move[1][1])
+
+    def swap(self, firstrow, firstcol, secondrow, secondcol):
+        self.zobristHash = None
+        if self.journal is not None:
+            self.journal.append((firstrow, firstcol, self.entries[firstrow][firstcol]))
+            self.journal.append((secondrow, secondcol, self.entries[secondrow][secondcol]))
         temp = self.entries[firstrow][firstcol]
         self.entries[firstrow][firstcol] = self.entries[secondrow][secondcol]
         self.entries[secondrow][secondcol] = temp
+        self.dirtyCells.add((firstrow, firstcol))
+        self.dirtyCells.add((secondrow, secondcol))
+        self.unsettledCells.add((firstrow, firstcol))
+        self.unsettledCells.add((secondrow, secondcol))
+
+    ###################
+    # make and unmake #
+    ###################
+
+    # A search can play a whole turn with pushMove and take it back with
+    # popMove, which costs about as much as the turn itself changed instead
+    # of a copy.deepcopy of the board.  The state of self.rng is restored
+    # too, so pushing the same move again gives the same refills.  If rng
+    # is the random module, that rewinds the global random state, choosers
+    # included; give the board its own random.Random to avoid that.
+
+    def saveCaches(self):
+        # what popMove needs to put back the cached moves and dirty cells
+        return (set(self.legalMoves), self.moveList, self.moveCodes,
+                set(self.dirtyCells), self.allDirty, set(self.unsettledCells),
+                self.allUnsettled)
+
+    def restoreCaches(self, caches, cells):
+        # put back saveCaches' state, after the (row, col) in cells have had
+        # their old colours restored
+        (self.legalMoves, self.moveList, self.moveCodes, self.dirtyCells,
+         self.allDirty, self.unsettledCells, self.allUnsettled) = caches
+
+    def saveState(self):
+        # everything restoreState needs to put the board back as it is now,
+        # caches included, e.g. to play several games from the same start
+        return ([row[:] for row in self.entries], self.score,
+                self.numberOfTurns, self.rng.getstate(), self.saveCaches(),
+                self.zobristHash)
+
+    def restoreState(self, state):
+        # put back a saveState, which can be restored again later
+        (entries, self.score, self.numberOfTurns, rngState, caches,
+         self.zobristHash) = state
+        e = self.entries
+        cells = []
+        for i in range(self.height):
+            for j in range(self.width):
+                if e[i][j] != entries[i][j]:
+                    e[i][j] = entries[i][j]
+                    cells.append((i, j))
+        self.rng.setstate(rngState)
+        # restoreCaches takes over the sets it's given
+        self.restoreCaches(tuple(set(x) if isinstance(x, set) else x
+                                 for x in caches), cells)
+
+    def pushMove(self, move):
+        # play a turn: apply move and evolve.  Return the number of chain
+        # reactions, as evolve does.
+        hashBefore = self.zobristHash
+        saved = (self.score, self.numberOfTurns, self.rng.getstate(),
+                 self.saveCaches(), hashBefore)
+        self.journal = []
+        self.applyMove(move)
+        self.numberOfTurns += 1
+        chains = self.evolve()
+        if hashBefore is not None:
+            # XOR out the old colour and in the new one of each changed cell
+            table = zobristTable(self.width * self.height, self.numberOfColours)
+            firstColour = {}
+            for (i, j, old) in self.journal:
+                if (i, j) not in firstColour:
+                    firstColour[(i, j)] = old
+            h = hashBefore
+            for (i, j), old in firstColour.items():
+                k = i * self.width + j
+                h ^= table[k][old] ^ table[k][self.entries[i][j]]
+            self.zobristHash = h
+        self.moveStack.append((self.journal,) + saved)
+        self.journal = None
+        return chains
+
+    def popMove(self):
+        # undo the last pushMove
+        (journal, self.score, self.numberOfTurns, rngState,
+         caches, self.zobristHash) = self.moveStack.pop()
+        e = self.entries
+        for (i, j, old) in reversed(journal):
+            e[i][j] = old
+        self.rng.setstate(rngState)
+        self.restoreCaches(caches, [(x[0], x[1]) for x in journal])
+
+
+class bitboard(board):
+    # The same game as board, but alongside self.entries we keep one big
+    # int per colour (0 included) with a bit set for each cell of that
+    # colour.  Entry [i,j] is bit i * (width + 1) + j: the extra bit at the
+    # end of each row is always 0, so a run of bits can never carry on from
+    # the end of one row onto the start of the next.  Runs and legal moves
+    # then come from a few shifts and ANDs per colour rather than a scan of
+    # every cell.
+    def __init__(self, width=8, height=8, numberOfColours=7, vanishLength=3,
+                 engine="bitboard", rng=None):
+        board.__init__(self, width, height, numberOfColours, vanishLength,
+                       rng=rng)
+        self.stride = self.width + 1
+        rowMask = (1 << self.width) - 1
+        self.boardMask = 0
+        for i in range(self.height):
+            self.boardMask |= rowMask << (i * self.stride)
+        self.masks = [0] * (self.numberOfColours + 1)
+        self.maskColours = [0] * (self.height * self.stride)
+        self.movesValid = False
+        # cells whose swap with the right-hand neighbour, and with the one
+        # below, is legit, as found by refreshMoves
+        self.moveBits = (0, 0)
+
+    def syncMasks(self):
+        # bring self.masks up to date with any cells which changed since the
+        # last call, using the dirty cells board keeps for legitMoves
+        if not (self.allDirty or self.dirtyCells):
+            return
+        s = self.stride
+        if self.allDirty or len(self.dirtyCells) * 4 > self.width * self.height:
+            masks = [0] * (self.numberOfColours + 1)
+            for i in range(self.height):
+                row = self.entries[i]
+                for j in range(self.width):
+                    masks[row[j]] |= 1 << (i * s + j)
+                    self.maskColours[i * s + j] = row[j]
+            self.masks = masks
+        else:
+            masks = self.masks
+            for (i, j) in self.dirtyCells:
+                k = i * s + j
+                bit = 1 << k
+                masks[self.maskColours[k]] &= ~bit
+                masks[self.entries[i][j]] |= bit
+                self.maskColours[k] = self.entries[i][j]
+        self.allDirty = False
+        self.dirtyCells = set()
+        self.movesValid = False
+
+    def saveCaches(self):
+        return board.saveCaches(self) + (self.movesValid, self.moveBits)
+
+    def restoreCaches(self, caches, cells):
+        board.restoreCaches(self, caches[:-2], cells)
+        self.movesValid, self.moveBits = caches[-2:]
+        # the masks were synced during the turn, so patch them back
+        s = self.stride
+        for (i, j) in cells:
+            k = i * s + j
+            bit = 1 << k
+            self.masks[self.maskColours[k]] &= ~bit
+            self.masks[self.entries[i][j]] |= bit
+            self.maskColours[k] = self.entries[i][j]
+
+    def runCells(self, m, step):
+        # the cells of m lying in a run of at least vanishLength along
+        # step (1 for rows, stride for columns)
+        starts = m
+        for k in range(1, self.vanishLength):
+            starts &= m >> (k * step)
+        cells = starts
+        for k in range(1, self.vanishLength):
+            cells |= starts << (k * step)
+        return cells
+
+    def monosIn(self, rows, cols):
+        # finding every mono is cheap enough with bitmasks
+        return self.findMonos()
+
+    def findMonos(self):
+        # same output as board.findMonos: horizontal monos row by row, then
+        # vertical monos column by column
+        self.syncMasks()
+        s = self.stride
+        horizontal = []
+        vertical = []
+        for m in self.masks:
+            if not m:
+                continue
+            h = self.runCells(m, 1)
+            while h:
+                start = (h & -h).bit_length() - 1
+                y = h >> start
+                length = ((y + 1) & ~y).bit_length() - 1  # trailing 1s
+                i, j = divmod(start, s)
+                horizontal.append([[i, x] for x in range(j, j + length)])
+                h &= ~(((1 << length) - 1) << start)
+            v = self.runCells(m, s)
+            while v:
+                start = (v & -v).bit_length() - 1
+                i, j = divmod(start, s)
+                k = start
+                mono = []
+                while (v >> k) & 1:
+                    mono.append([i, j])
+                    v &= ~(1 << k)
+                    i += 1
+                    k += s
+                vertical.append(mono)
+        horizontal.sort(key=lambda mono: mono[0])
+        vertical.sort(key=lambda mono: (mono[0][1], mono[0][0]))
+        return horizontal + vertical
+
+    def refreshMoves(self):
+        # For each colour c with mask m we find the cells which would
+        # complete a run of c if they took the colour of their right-hand or
+        # lower neighbour (p below), and the neighbours which would complete
+        # a run if they took the colour of that cell (q below).
+        self.syncMasks()
+        if self.movesValid:
+            return
+        s = self.stride
+        full = self.boardMask
+        reach = self.vanishLength - 1
+        horizontalMoves = 0
+        verticalMoves = 0
+        for m in self.masks:
+            if not m:
+                continue
+            # left[a] = cells whose a left neighbours are all in m, etc.
+            left = [full]
+            right = [full]
+            up = [full]
+            down = [full]
+            for k in range(1, reach + 1):
+                left.append(left[-1] & (m << k))
+                right.append(right[-1] & (m >> k))
+                up.append(up[-1] & (m << (k * s)))
+                down.append(down[-1] & (m >> (k * s)))
+            across = 0
+            along = 0
+            for a in range(reach + 1):
+                across |= left[a] & right[reach - a]
+                along |= up[a] & down[reach - a]
+            other = full & ~m
+            # swap with the right-hand neighbour
+            p = (m >> 1) & other & (left[reach] | along)
+            q = (m << 1) & other & (right[reach] | along)
+            horizontalMoves |= p | (q >> 1)
+            # swap with the neighbour below
+            p = (m >> s) & other & (up[reach] | across)
+            q = (m << s) & other & (down[reach] | across)
+            verticalMoves |= p | (q >> s)
+        self.moveBits = (horizontalMoves, verticalMoves)
+        self.moveList = None
+        self.moveCodes = None
+        self.movesValid = True
+
+    def legitMoves(self):
+        # same output as board.legitMoves
+        self.refreshMoves()
+        if self.moveList is None:
+            s = self.stride
+            horizontalMoves, verticalMoves = self.moveBits
+            self.moveList = []
+            moves = horizontalMoves | verticalMoves
+            while moves:
+                bit = moves & -moves
+                i, j = divmod(bit.bit_length() - 1, s)
+                if horizontalMoves & bit:
+                    self.moveList.append([[i, j], [i, j + 1]])
+                if verticalMoves & bit:
+                    self.moveList.append([[i, j], [i + 1, j]])
+                moves ^= bit
+        return self.moveList, len(self.moveList)
+
+    def legitMoveCodes(self):
+        # same output as board.legitMoveCodes
+        self.refreshMoves()
+        if self.moveCodes is None:
+            s = self.stride
+            w = self.width
+            horizontalMoves, verticalMoves = self.moveBits
+            codes = moveCodes(w)
+            moves = horizontalMoves | verticalMoves
+            while moves:
+                bit = moves & -moves
+                i, j = divmod(bit.bit_length() - 1, s)
+                cell = 2 * (i * w + j)
+                if horizontalMoves & bit:
+                    codes.append(cell)
+                if verticalMoves & bit:
+                    codes.append(cell + 1)
+                moves ^= bit
+            self.moveCodes = codes
+        return self.moveCodes
+
+
+class boardBatch(object):
+    # numberOfBoards boards played in lockstep, stored as one
+    # (numberOfBoards, height, width) array of int8.  A single board is
+    # faster as lists (see the comment in board), but here every step is a
+    # handful of numpy operations over all the boards at once.  Boards
+    # are dropped with keep() as their games finish.
+    def __init__(self, numberOfBoards, width=8, height=8, numberOfColours=7,
+                 vanishLength=3):
+        self.width = width
+        self.height = height
+        self.numberOfColours = numberOfColours
+        self.vanishLength = vanishLength
+        self.entries = np.zeros((numberOfBoards, height, width), dtype=np.int8)
+        self.scores = np.zeros(numberOfBoards, dtype=np.int64)
+        self.numberOfTurns = np.zeros(numberOfBoards, dtype=np.int64)
+
+    def __len__(self):
+        return self.entries.shape[0]
+
+    def keep(self, mask):
+        # drop the boards where mask is False
+        self.entries = self.entries[mask]
+        self.scores = self.scores[mask]
+        self.numberOfTurns = self.numberOfTurns[mask]
+
+    def randomize(self):
+        self.entries[...] = np.random.randint(1, self.numberOfColours + 1,
+                                              size=self.entries.shape)
+
+    def shifts(self, e):
+        # at(di, dj)[k, i, j] is e[k, i + di, j + dj], or -1 off the board
+        r = self.vanishLength
+        n, h, w = e.shape
+        padded = np.full((n, h + 2 * r, w + 2 * r), -1, dtype=np.int8)
+        padded[:, r:r + h, r:r + w] = e
+
+        def at(di, dj):
+            return padded[:, r + di:r + di + h, r + dj:r + dj + w]
+        return at
+
+    def runStarts(self, e):
+        # boolean arrays across, down: across[k, i, j] says a run of
+        # vanishLength cells of one colour starts at [i,j] on board k and
+        # goes right, down the same going down
+        at = self.shifts(e)
+        across = e > 0
+        down = e > 0
+        for k in range(1, self.vanishLength):
+            across = across & (at(0, k) == e)
+            down = down & (at(k, 0) == e)
+        return across, down
+
+    def spread(self, starts, axis):
+        # the cells in the runs starting at starts, going along axis (2 for
+        # across, 1 for down)
+        cells = starts.copy()
+        for k in range(1, self.vanishLength):
+            if axis == 2:
+                cells[:, :, k:] |= starts[:, :, :-k]
+            else:
+                cells[:, k:, :] |= starts[:, :-k, :]
+        return cells
+
+    def findMonos(self, e):
+        # return a boolean array marking the cells of e in monos, and the
+        # score each board gets for them.  A mono of length l is worth
+        # l - vanishLength + 1, which is the number of runs of exactly
+        # vanishLength inside it, so we just count those.
+        across, down = self.runStarts(e)
+        gain = across.sum(axis=(1, 2)) + down.sum(axis=(1, 2))
+        return self.spread(across, 2) | self.spread(down, 1), gain
+
+    def gravity(self, e):
+        # a stable sort of each column by "is nonzero" drops the blocks to the
+        # bottom and leaves the zeros on top
+        order = np.argsort(e != 0, axis=1, kind="mergesort")
+        return np.take_along_axis(e, order, axis=1)
+
+    def randomFillZeroes(self, e):
+        zeroes = e == 0
+        e[zeroes] = np.random.randint(1, self.numberOfColours + 1,
+                                      size=int(zeroes.sum()))
+
+    def evolve(self):
+        # evolve every board until it has no monos, returning the number of
+        # chain reactions on each board as in board.evolve
+        chains = np.full(len(self), -1, dtype=np.int64)
+        active = np.arange(len(self))
+        e = self.entries
+        while active.size:
+            cells, gain = self.findMonos(e)
+            hasMonos = gain > 0
+            if not hasMonos.any():
+                break
+            active = active[hasMonos]
+            e = e[hasMonos]
+            cells = cells[hasMonos]
+            chains[active] += 1
+            self.scores[active] += gain[hasMonos]
+            e[cells] = 0
+            e = self.gravity(e)
+            self.randomFillZeroes(e)
+            self.entries[active] = e
+        return chains
+
+    def legitMoves(self):
+        # return boolean arrays right, below: right[k, i, j] says swapping
+        # [i,j] with [i,j+1] on board k is legit, below[k, i, j] the same for
+        # swapping [i,j] with [i+1,j].  This is the bitboard calculation with
+        # arrays in place of bitmasks.
+        e = self.entries
+        at = self.shifts(e)
+        reach = self.vanishLength - 1
+
+        def completes(colour, di, dj):
+            # would cells taking colour, from their neighbour at (di, dj),
+            # be in a mono?  Look for a run of colour leading away from that
+            # neighbour, or a run through the cell at right angles to it.
+            def run(si, sj):
+                runs = [np.ones(e.shape, dtype=bool)]
+                for k in range(1, reach + 1):
+                    runs.append(runs[-1] & (at(k * si, k * sj) == colour))
+                return runs
+            away = run(-di, -dj)
+            one = run(dj, di)
+            other = run(-dj, -di)
+            result = away[reach]
+            for a in range(reach + 1):
+                result = result | (one[a] & other[reach - a])
+            return result & (colour > 0) & (colour != e)
+
+        right = completes(at(0, 1), 0, 1)
+        q = completes(at(0, -1), 0, -1)
+        right[:, :, :-1] |= q[:, :, 1:]
+        below = completes(at(1, 0), 1, 0)
+        q = completes(at(-1, 0), -1, 0)
+        below[:, :-1, :] |= q[:, 1:, :]
+        return right, below
+
+    def moveLists(self, right, below):
+        # turn the output of legitMoves into one list of moves per board, in
+        # the same form and order as board.legitMoves
+        lists = [[] for k in range(len(self))]
+        ks, iis, jjs = np.nonzero(right | below)
+        rs = right[ks, iis, jjs].tolist()
+        bs = below[ks, iis, jjs].tolist()
+        for k, i, j, r, b in zip(ks.tolist(), iis.tolist(), jjs.tolist(), rs, bs):
+            if r:
+                lists[k].append([[i, j], [i, j + 1]])
+            if b:
+                lists[k].append([[i, j], [i + 1, j]])
+        return lists
+
+    def moveCodeLists(self, right, below):
+        # the same as moveLists, but a moveCodes per board.  Interleaving
+        # right and below cell by cell puts the code of each move at its
+        # index, in order.
+        n = right.shape[0]
+        both = np.stack([right.reshape(n, -1), below.reshape(n, -1)], axis=2)
+        both = both.reshape(n, -1)
+        ks, codes = np.nonzero(both)
+        ends = np.cumsum(both.sum(axis=1)).tolist()
+        codes = codes.astype(np.int32)
+        return [moveCodes(self.width, codes[a:b].tolist())
+                for a, b in zip([0] + ends[:-1], ends)]
+
+    def applyMoveCodes(self, codes):
+        # apply the move packed in codes[k] to board k
+        codes = np.array(codes)
+        d = codes & 1
+        i1, j1 = np.divmod(codes >> 1, self.width)
+        self.swap(i1, j1, i1 + d, j1 + 1 - d)
+
+    def applyMoves(self, moves):
+        # apply moves[k] to board k
+        i1 = np.array([m[0][0] for m in moves])
+        j1 = np.array([m[0][1] for m in moves])
+        i2 = np.array([m[1][0] for m in moves])
+        j2 = np.array([m[1][1] for m in moves])
+        self.swap(i1, j1, i2, j2)
+
+    def swap(self, i1, j1, i2, j2):
+        # swap [i1[k], j1[k]] with [i2[k], j2[k]] on board k
+        ks = np.arange(len(self))
+        temp = self.entries[ks, i1, j1]
+        self.entries[ks, i1, j1] = self.entries[ks, i2, j2]
+        self.entries[ks, i2, j2] = temp
+
+
+class tileSet(object):
+    # numpy views of a tiledBoard's shared buffers (the grid of colours, the
+    # cells in horizontal and vertical monos, and the legal moves right and
+    # below, as in boardBatch.legitMoves), and the work on one strip of
+    # columns.  The board makes one, and so does each of its worker
+    # processes, from the same buffers.
+    def __init__(self, buffers, width, height, numberOfColours, vanishLength,
+                 strips):
+        (self.grid, self.horizontal, self.vertical, self.right,
+         self.below) = [np.frombuffer(b, dtype=np.int8).reshape(height, width)
+                        for b in buffers]
+        self.width = width
+        self.strips = strips
+        # Whether a cell is in a mono depends on the vanishLength - 1 cells
+        # either side of it, and whether swapping it with its right-hand
+        # neighbour is legal on the vanishLength cells to its right.
+        self.halo = vanishLength
+        self.batch = boardBatch(0, width, height, numberOfColours,
+                                vanishLength)
+
+    def work(self, op, k):
+        # do op on strip k: "monos" marks the cells in monos in the strip's
+        # columns and returns their score, "fall" zeroes those cells and
+        # drops the blocks above them, "gravity" just drops the blocks, and
+        # "moves" marks the legal moves from the strip's cells.  Only
+        # "monos" and "moves" look outside the strip, at its halo, and they
+        # only read the grid, so the strips can all be done at once.
+        a, b = self.strips[k]
+        wa = max(0, a - self.halo)
+        wb = min(self.width, b + self.halo)
+        own = slice(a - wa, b - wa)
+        if op == "monos":
+            across, down = self.batch.runStarts(self.grid[None, :, wa:wb])
+            self.horizontal[:, a:b] = self.batch.spread(across, 2)[0, :, own]
+            self.vertical[:, a:b] = self.batch.spread(down, 1)[0, :, own]
+            return int(across[0, :, own].sum() + down[0, :, own].sum())
+        columns = self.grid[:, a:b]
+        if op == "fall":
+            columns[(self.horizontal[:, a:b] | self.vertical[:, a:b]) != 0] = 0
+            op = "gravity"
+        if op == "gravity":
+            columns[...] = self.batch.gravity(columns[None])[0]
+        elif op == "moves":
+            self.batch.entries = self.grid[None, :, wa:wb]
+            right, below = self.batch.legitMoves()
+            self.right[:, a:b] = right[0, :, own]
+            self.below[:, a:b] = below[0, :, own]
+
+
+# the tileSet of a tiledBoard's worker process
+workerTiles = None
+
+
+def attachTiles(*args):
+    # start a tiledBoard's worker process, see tileSet
+    global workerTiles
+    workerTiles = tileSet(*args)
+
+
+def tileWork(args):
+    op, k = args
+    return workerTiles.work(op, k)
+
+
+# the number of worker processes a tiledBoard uses by default
+tiledProcesses = multiprocessing.cpu_count()
+
+
+class tiledBoard(board):
+    # The same game as board, for very large boards: the colours live in a
+    # numpy array in shared memory, cut into strips of columns, and
+    # finding monos, gravity and finding legal moves work on all the strips
+    # at once in processes worker processes (by default tiledProcesses).
+    # The workers see the board's buffers directly, so nothing is copied
+    # from turn to turn.  Each strip is looked at with a halo of the
+    # columns either side it depends on, see tileSet.  A mono's score is
+    # the number of runs of vanishLength in it, as in boardBatch, and each
+    # strip counts the runs starting in its own columns, so monos across
+    # strip boundaries come out right when the strips' scores are added.
+    #
+    # Refills are drawn by this process in the same order as board's, so
+    # a tiledBoard plays exactly the same games as the other engines.
+    # pushMove copies the whole board, so the choosers that search
+    # (wantsBoard) are left to the other engines, see playGame.  Call
+    # close() when done with the board to stop the workers.  For boards of
+    # a few hundred cells the other engines are much faster.
+    def __init__(self, width=8, height=8, numberOfColours=7, vanishLength=3,
+                 engine="tiled", rng=None, processes=None):
+        board.__init__(self, width, height, numberOfColours, vanishLength,
+                       rng=rng)
+        if processes is None:
+            processes = tiledProcesses
+        if multiprocessing.current_process().daemon:
+            # testStrategy's workers can't start workers of their own
+            processes = 1
+        self.processes = max(1, min(processes, width))
+        bounds = [width * k // self.processes
+                  for k in range(self.processes + 1)]
+        self.strips = list(zip(bounds[:-1], bounds[1:]))
+        self.buffers = [multiprocessing.RawArray("b", width * height)
+                        for k in range(5)]
+        self.tileArgs = (self.buffers, width, height, numberOfColours,
+                         vanishLength, self.strips)
+        self.tiles = tileSet(*self.tileArgs)
+        self.entries = self.tiles.grid
+        # boardBatch's helpers for turning move arrays into lists and codes
+        self.batch = boardBatch(1, width, height, numberOfColours,
+                                vanishLength)
+        self.pool = None
+        self.movesValid = False
+
+    def onTiles(self, op):
+        # do op on every strip, see tileSet.work, and return the results
+        if self.processes == 1:
+            return [self.tiles.work(op, k) for k in range(len(self.strips))]
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.processes, attachTiles,
+                                             self.tileArgs)
+        return self.pool.map(tileWork, [(op, k)
+                                        for k in range(len(self.strips))])
+
+    def close(self):
+        # stop the workers; the board can still be used, and starts them
+        # again if it needs them
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+    def randomize(self):
+        # column by column, as board.randomize draws them
+        colours = [self.rng.randint(1, self.numberOfColours)
+                   for k in range(self.width * self.height)]
+        self.entries.T[...] = np.array(colours).reshape(self.width,
+                                                        self.height)
+        self.invalidateMoves()
+
+    def invalidateMoves(self):
+        board.invalidateMoves(self)
+        self.movesValid = False
+
+    def findMonos(self):
+        # same output as board.findMonos
+        self.onTiles("monos")
+        e = self.entries
+        output = []
+        for mask, grid, transposed in ((self.tiles.horizontal, e, False),
+                                       (self.tiles.vertical.T, e.T, True)):
+            marked = mask != 0
+            # a mono starts at a marked cell unless the cell before it in
+            # the row is marked and the same colour
+            carries = np.zeros(marked.shape, dtype=bool)
+            carries[:, 1:] = marked[:, :-1] & (grid[:, 1:] == grid[:, :-1])
+            ends = np.zeros(marked.shape, dtype=bool)
+            ends[:, :-1] = carries[:, 1:]
+            starts = zip(*np.nonzero(marked & ~carries))
+            stops = zip(*np.nonzero(marked & ~ends))
+            for (i, j), (k, l) in zip(starts, stops):
+                if transposed:
+                    output.append([[x, int(i)] for x in range(j, l + 1)])
+                else:
+                    output.append([[int(i), x] for x in range(j, l + 1)])
+        return output
+
+    def gravity(self):
+        self.onTiles("gravity")
+        self.invalidateMoves()
+
+    def randomFillZeroes(self):
+        # row by row, as board.randomFillZeroes draws them
+        zeroes = np.flatnonzero(self.entries == 0)
+        if len(zeroes):
+            self.entries.flat[zeroes] = [
+                self.rng.randint(1, self.numberOfColours)
+                for k in range(len(zeroes))]
+            self.invalidateMoves()
+
+    def evolve(self):
+        # as board.evolve, a chain reaction at a time over the whole board
+        chains = -1
+        while True:
+            gain = sum(self.onTiles("monos"))
+            if gain == 0:
+                return chains
+            chains += 1
+            self.score += gain
+            self.dropColumns()
+            self.randomFillZeroes()
+
+    def dropColumns(self):
+        # evolve's gravity: zero the cells the last "monos" marked and drop
+        # the blocks above them
+        self.onTiles("fall")
+
+    def refreshMoves(self):
+        if not self.movesValid:
+            self.onTiles("moves")
+            self.moveList = None
+            self.moveCodes = None
+            self.movesValid = True
+
+    def legitMoves(self):
+        # same output as board.legitMoves
+        self.refreshMoves()
+        if self.moveList is None:
+            self.moveList = self.batch.moveLists(self.tiles.right[None] != 0,
+                                                 self.tiles.below[None] != 0)[0]
+        return self.moveList, len(self.moveList)
+
+    def legitMoveCodes(self):
+        # same output as board.legitMoveCodes
+        self.refreshMoves()
+        if self.moveCodes is None:
+            self.moveCodes = self.batch.moveCodeLists(
+                self.tiles.right[None] != 0, self.tiles.below[None] != 0)[0]
+        return self.moveCodes
+
+    def swap(self, firstrow, firstcol, secondrow, secondcol):
+        e = self.entries
+        e[firstrow, firstcol], e[secondrow, secondcol] = (
+            e[secondrow, secondcol], e[firstrow, firstcol])
+        self.invalidateMoves()
+
+    def saveState(self):
+        return (self.entries.copy(), self.score, self.numberOfTurns,
+                self.rng.getstate())
+
+    def restoreState(self, state):
+        entries, self.score, self.numberOfTurns, rngState = state
+        self.entries[...] = entries
+        self.rng.setstate(rngState)
+        self.invalidateMoves()
+
+    def pushMove(self, move):
+        # play a turn, keeping a copy of the whole board to take it back
+        self.moveStack.append(self.saveState())
+        self.applyMove(move)
+        self.numberOfTurns += 1
+        return self.evolve()
+
+    def popMove(self):
+        self.restoreState(self.moveStack.pop())
+
+
+engines = {"list": board, "bitboard": bitboard, "tiled": tiledBoard}
+
+
+def playBatch(chooser, numberOfGames, width=8, height=8, numberOfColours=7,
+              vanishLength=3, batchSize=10000, packed=False):
+    # play numberOfGames games batchSize at a time on boardBatches, yielding
+    # the same records as playGame as each game finishes.  With packed=True
+    # chooser is given moveCodes, as in playGame.
+    if getattr(chooser, "wantsBoard", False):
+        raise ValueError("choosers that need the board can't use the batch engine")
+    while numberOfGames > 0:
+        n = min(batchSize, numberOfGames)
+        numberOfGames -= n
+        bb = boardBatch(n, width, height, numberOfColours, vanishLength)
+        bb.randomize()
+        histories = [([], [], [], [], []) for k in range(n)]
+        rowNumbers = np.arange(height)
+        while len(bb):
+            before = bb.scores.copy()
+            chains = bb.evolve().tolist()
+            gains = (bb.scores - before).tolist()
+            right, below = bb.legitMoves()
+            perRow = right.sum(axis=2) + below.sum(axis=2)
+            counts = perRow.sum(axis=1)
+            heights = (perRow * rowNumbers).sum(axis=1) / (1.0 * np.maximum(counts, 1))
+            for k in range(n):
+                movesAvailable, chainsThisGame, meanHeights, moves, scoreDeltas = histories[k]
+                movesAvailable.append(int(counts[k]))
+                chainsThisGame.append(chains[k])
+                scoreDeltas.append(gains[k])
+                if counts[k]:
+                    meanHeights.append(float(heights[k]))
+            finished = counts == 0
+            for k in np.nonzero(finished)[0].tolist():
+                yield ((int(bb.scores[k]), int(bb.numberOfTurns[k])) +
+                       histories[k])
+            live = ~finished
+            bb.keep(live)
+            histories = [histories[k] for k in np.nonzero(live)[0].tolist()]
+            n = len(bb)
+            if n == 0:
+                break
+            if packed:
+                codes = [chooser(m) for m in bb.moveCodeLists(right[live], below[live])]
+                bb.applyMoveCodes(codes)
+            else:
+                moves = [chooser(m) for m in bb.moveLists(right[live], below[live])]
+                codes = [encodeMove(m, width) for m in moves]
+                bb.applyMoves(moves)
+            for k in range(n):
+                histories[k][3].append(codes[k])
+            bb.numberOfTurns += 1
 
 
 # strategies:
@@ -218,79 +1403,1083 @@ class board(object):
         # mixed
         # approximate the play that maximises something or other
 
-def testStrategy(chooser, numberOfGames, width=8, height=8, numberOfColours=7):
+########################
+# streaming statistics #
+########################
+
+# the same fields as scipy.stats.describe, so they print the same way
+DescribeResult = namedtuple("DescribeResult", ("nobs", "minmax", "mean",
+                                               "variance", "skewness",
+                                               "kurtosis"))
+
+
+def describeMoments(n, minmax, mean, m2, m3, m4):
+    # like scipy.stats.describe, from the count, min and max, mean and the
+    # central moments m2, m3, m4 (sums of powers of deviations divided by n)
+    if n > 1:
+        variance = m2 * n / (n - 1.0)
+    else:
+        variance = float("nan")
+    if m2 == 0:
+        skewness = 0.0
+        kurtosis = -3.0
+    else:
+        skewness = m3 / m2 ** 1.5
+        kurtosis = m4 / m2 ** 2 - 3.0
+    return DescribeResult(n, minmax, mean, variance, skewness, kurtosis)
+
+
+class intHistogram(Counter):
+    # A Counter of integer observations that can describe itself like
+    # scipy.stats does for the list of observations.  Game statistics take
+    # few distinct values, so this stays small however many games we play,
+    # and two histograms merge with update().
+    def add(self, x):
+        self[x] += 1
+
+    def count(self):
+        return sum(self.values())
+
+    def mean(self):
+        return sum(k * c for k, c in self.items()) / (1.0 * self.count())
+
+    def describe(self):
+        n = self.count()
+        mean = self.mean()
+        m2 = m3 = m4 = 0.0
+        for k, c in self.items():
+            d = k - mean
+            m2 += c * d * d
+            m3 += c * d * d * d
+            m4 += c * d * d * d * d
+        return describeMoments(n, (min(self), max(self)), mean,
+                               m2 / n, m3 / n, m4 / n)
+
+    def sd(self):
+        # the sample standard deviation, scipy.stats.tstd
+        return self.describe().variance ** 0.5
+
+    def quantile(self, q):
+        # the smallest value with at least a fraction q of the observations
+        # at or below it
+        target = q * self.count()
+        seen = 0
+        for k in sorted(self):
+            seen += self[k]
+            if seen >= target:
+                return k
+
+
+def ksTest(a, b):
+    # the two-sample Kolmogorov-Smirnov statistic D for intHistograms a and
+    # b (the largest gap between their cumulative distributions) and its
+    # asymptotic p-value, as scipy.stats.ks_2samp gives for the
+    # observations
+    n = a.count()
+    m = b.count()
+    d = 0.0
+    fa = fb = 0
+    for k in sorted(set(a) | set(b)):
+        fa += a.get(k, 0)
+        fb += b.get(k, 0)
+        d = max(d, abs(fa / (1.0 * n) - fb / (1.0 * m)))
+    return d, stat.kstwobign.sf(d * (n * m / (1.0 * (n + m))) ** 0.5)
+
+
+class runningStats(object):
+    # count, mean and central moments up to the fourth of a stream of
+    # numbers, updated a value at a time in constant memory.  Two of them
+    # can be merged, e.g. when they come from different worker processes.
+    # The update formulas are the usual one-pass ones (Welford, Terriberry,
+    # Pebay).
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.m3 = 0.0
+        self.m4 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, x):
+        n1 = self.n
+        self.n += 1
+        n = self.n
+        delta = x - self.mean
+        deltaN = delta / n
+        term = delta * deltaN * n1
+        self.mean += deltaN
+        self.m4 += (term * deltaN * deltaN * (n * n - 3 * n + 3) +
+                    6 * deltaN * deltaN * self.m2 - 4 * deltaN * self.m3)
+        self.m3 += term * deltaN * (n - 2) - 3 * deltaN * self.m2
+        self.m2 += term
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+
+    def merge(self, other):
+        if other.n == 0:
+            return
+        if self.n == 0:
+            self.__dict__.update(other.__dict__)
+            return
+        na, nb = self.n, other.n
+        n = na + nb
+        delta = other.mean - self.mean
+        m2 = self.m2 + other.m2 + delta * delta * na * nb / n
+        m3 = (self.m3 + other.m3 +
+              delta ** 3 * na * nb * (na - nb) / (n * n) +
+              3.0 * delta * (na * other.m2 - nb * self.m2) / n)
+        m4 = (self.m4 + other.m4 +
+              delta ** 4 * na * nb * (na * na - na * nb + nb * nb) / (n ** 3) +
+              6.0 * delta * delta * (na * na * other.m2 + nb * nb * self.m2) / (n * n) +
+              4.0 * delta * (na * other.m3 - nb * self.m3) / n)
+        self.mean = (na * self.mean + nb * other.mean) / (1.0 * n)
+        self.n, self.m2, self.m3, self.m4 = n, m2, m3, m4
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def describe(self):
+        return describeMoments(self.n, (self.min, self.max), self.mean,
+                               self.m2 / self.n, self.m3 / self.n,
+                               self.m4 / self.n)
+
+
+class gameStats(object):
+    # Everything testStrategy records about a run, as histograms and
+    # running moments rather than lists, so memory doesn't grow with the
+    # number of turns played.
+    #
+    # deltasByPosition[n] is the histogram of the change in the number of
+    # available moves from turns where n moves were available ("position"),
+    # and meanHeightMovesAvailableByPosition[n] has the running moments of
+    # the mean height of the moves available at those turns.
+    def __init__(self):
+        self.scores = intHistogram()
+        self.lengths = intHistogram()
+        self.lengthsAndScores = Counter()
+        self.deltaMovesAvailable = intHistogram()
+        self.initialMovesAvailable = intHistogram()
+        self.maxMovesAvailable = intHistogram()
+        self.chains = intHistogram()
+        self.allMovesAvailable = intHistogram()
+        self.deltasByPosition = defaultdict(intHistogram)
+        self.meanHeightMovesAvailableByPosition = defaultdict(runningStats)
+        # a hotPathTimings if the run was instrumented
+        self.timings = None
+        # from a worker process: a traceBuffer of the games, if the run is
+        # being traced.  merge() leaves it out; testStrategy writes it.
+        self.trace = None
+
+    def addGame(self, game):
+        # add a playGame record
+        score, length, movesAvailable, chains, meanHeights = game[:5]
+        self.scores[score] += 1
+        self.lengths[length] += 1
+        self.lengthsAndScores[(length, score)] += 1
+        for c in chains:
+            self.chains[c] += 1
+        for ii in range(len(meanHeights)):
+            self.meanHeightMovesAvailableByPosition[movesAvailable[ii]].add(meanHeights[ii])
+        for ii in range(len(movesAvailable) - 1):
+            delta = movesAvailable[ii + 1] - movesAvailable[ii]
+            self.deltaMovesAvailable[delta] += 1
+            self.deltasByPosition[movesAvailable[ii]][delta] += 1
+        self.initialMovesAvailable[movesAvailable[0]] += 1
+        self.maxMovesAvailable[max(movesAvailable)] += 1
+        for n in movesAvailable:
+            self.allMovesAvailable[n] += 1
+
+    def merge(self, other):
+        for name in ("scores", "lengths", "lengthsAndScores",
+                     "deltaMovesAvailable", "initialMovesAvailable",
+                     "maxMovesAvailable", "chains", "allMovesAvailable"):
+            getattr(self, name).update(getattr(other, name))
+        for k, h in other.deltasByPosition.items():
+            self.deltasByPosition[k].update(h)
+        for k, r in other.meanHeightMovesAvailableByPosition.items():
+            self.meanHeightMovesAvailableByPosition[k].merge(r)
+        if other.timings is not None:
+            if self.timings is None:
+                self.timings = hotPathTimings()
+            self.timings.merge(other.timings)
+
+    def lengthScoreCorrelation(self):
+        # Pearson's r between lengths and scores and its two-sided p-value,
+        # as scipy.stats.pearsonr would give (nan and nan when the lengths
+        # or the scores are all the same, e.g. for one game)
+        n = self.lengthsAndScores
+        total = sum(n.values())
+        ml = self.lengths.mean()
+        ms = self.scores.mean()
+        sll = sum(c * (l - ml) ** 2 for (l, s), c in n.items())
+        sss = sum(c * (s - ms) ** 2 for (l, s), c in n.items())
+        sls = sum(c * (l - ml) * (s - ms) for (l, s), c in n.items())
+        if sll * sss == 0:
+            return float("nan"), float("nan")
+        r = max(-1.0, min(1.0, sls / (sll * sss) ** 0.5))
+        if abs(r) == 1.0 or total < 3:
+            return r, 0.0
+        t = r * ((total - 2) / (1.0 - r * r)) ** 0.5
+        return r, 2 * stat.t.sf(abs(t), total - 2)
+
+
+###################
+# instrumentation #
+###################
+
+# the board methods hotPathTimings times, and the names it reports some of
+# them by: evolve's own gravity step counts as gravity
+timedMethods = ("findMonos", "monosIn", "legitMoves", "legitMoveCodes",
+                "evolve", "gravity", "dropColumns", "randomFillZeroes",
+                "applyMove", "applyMoveCode")
+timedNames = {"dropColumns": "gravity"}
+
+
+class countingRng(object):
+    # stands in for a board's rng, counting and timing the colours it draws
+    def __init__(self, rng, timings):
+        self.rng = rng
+        self.timings = timings
+
+    def randint(self, a, b):
+        start = time.time()
+        colour = self.rng.randint(a, b)
+        self.timings.seconds["refills"] += time.time() - start
+        self.timings.calls["refills"] += 1
+        return colour
+
+    def __getattr__(self, name):
+        return getattr(self.rng, name)
+
+
+class hotPathTimings(object):
+    # Calls to and seconds spent in the board's hot paths and the chooser,
+    # collected by testStrategy(..., instrument=True).  instrument(b)
+    # replaces b's methods with timed wrappers on that instance only, so a
+    # board nobody instrumented runs exactly as before.  Times are
+    # inclusive: evolve's includes the monosIn calls it makes, and so on.
+    # "refills" counts the colours drawn by randomize and evolve, and
+    # "cascade steps" the rounds of monos evolve cleared.  The batch engine
+    # has no boards to instrument, so only its chooser is timed.
+    # testStrategy fills in the games, turns and wall clock seconds.
+    def __init__(self):
+        self.calls = Counter()
+        self.seconds = Counter()
+        self.games = 0
+        self.turns = 0
+        self.wallSeconds = 0.0
+
+    def timed(self, name, f):
+        def wrapper(*args):
+            start = time.time()
+            result = f(*args)
+            self.seconds[name] += time.time() - start
+            self.calls[name] += 1
+            return result
+        return wrapper
+
+    def instrument(self, b):
+        for name in timedMethods:
+            setattr(b, name, self.timed(timedNames.get(name, name),
+                                        getattr(b, name)))
+        evolve = b.evolve
+
+        def countingEvolve():
+            chains = evolve()
+            self.calls["cascade steps"] += chains + 1
+            return chains
+        b.evolve = countingEvolve
+        b.rng = countingRng(b.rng, self)
+
+    def merge(self, other):
+        self.calls.update(other.calls)
+        self.seconds.update(other.seconds)
+
+    def report(self):
+        # a line per timed thing, then the totals
+        lines = []
+        for name in sorted(self.calls, key=lambda n: -self.seconds[n]):
+            calls = self.calls[name]
+            line = name + " calls " + str(calls)
+            if name in self.seconds:
+                line += (" seconds " + str(round(self.seconds[name], 3)) +
+                         " us/call " +
+                         str(round(1e6 * self.seconds[name] / calls, 2)))
+            lines.append(line)
+        lines.append("games " + str(self.games) + " turns " + str(self.turns) +
+                     " seconds " + str(round(self.wallSeconds, 3)))
+        if self.wallSeconds:
+            lines.append("games/sec " + str(round(self.games / self.wallSeconds, 2)) +
+                         " turns/sec " + str(round(self.turns / self.wallSeconds, 1)))
+        return "\n".join(lines)
+
+
+##########
+# traces #
+##########
+
+# A trace keeps a row per position of every game: the position after the
+# starting board settles is turn 0, and the last turn is the one with no
+# moves left.  It's a directory holding one file per column of raw
+# little-endian numbers, so it can be appended to as games finish and read
+# back with numpy.memmap without loading it.  A row holds
+#   game            the game's number in its run
+#   turn            the position's number in its game
+#   movesAvailable  the number of legal moves there
+#   move            the move played from there, see encodeMove, or -1 at
+#                   the end
+#   scoreDelta      the points gained getting there (for turn 0, from the
+#                   starting board)
+#   chains          the chain reactions getting there, as evolve counts them
+#   meanHeight      the mean row of the moves available, or nan at the end
+traceColumns = [("game", "<i8"), ("turn", "<i4"), ("movesAvailable", "<i4"),
+                ("move", "<i4"), ("scoreDelta", "<i4"), ("chains", "<i4"),
+                ("meanHeight", "<f8")]
+
+
+class traceBuffer(object):
+    # rows of finished games waiting to be appended to a trace; small enough
+    # to send back from a worker process with its chunk's gameStats
+    def __init__(self):
+        self.columns = dict((name, []) for name, dtype in traceColumns)
+
+    def __len__(self):
+        return len(self.columns["game"])
+
+    def addGame(self, gameId, game):
+        # add the rows of a playGame record
+        score, length, movesAvailable, chains, meanHeights, moves, deltas = game
+        c = self.columns
+        c["game"].extend([gameId] * (length + 1))
+        c["turn"].extend(range(length + 1))
+        c["movesAvailable"].extend(movesAvailable)
+        c["move"].extend(moves)
+        c["move"].append(-1)
+        c["scoreDelta"].extend(deltas)
+        c["chains"].extend(chains)
+        c["meanHeight"].extend(meanHeights)
+        c["meanHeight"].append(float("nan"))
+
+    def appendTo(self, path):
+        # append our rows to the trace in directory path, making it if need
+        # be, and empty the buffer
+        if not os.path.isdir(path):
+            os.mkdir(path)
+        for name, dtype in traceColumns:
+            with open(os.path.join(path, name), "ab") as f:
+                np.array(self.columns[name], dtype=dtype).tofile(f)
+            self.columns[name] = []
+
+
+def traceRows(path):
+    # the number of rows in the trace in directory path
+    if not os.path.isdir(path):
+        return 0
+    return os.path.getsize(os.path.join(path, "game")) // 8
+
+
+def truncateTrace(path, rows):
+    # cut the trace in directory path, if there is one, back to its first
+    # rows rows
+    if os.path.isdir(path):
+        for name, dtype in traceColumns:
+            with open(os.path.join(path, name), "r+b") as f:
+                f.truncate(rows * np.dtype(dtype).itemsize)
+
+
+def readTrace(path):
+    # the columns of the trace in directory path, as read-only memory maps
+    columns = {}
+    for name, dtype in traceColumns:
+        filename = os.path.join(path, name)
+        if os.path.getsize(filename) == 0:
+            columns[name] = np.zeros(0, dtype=dtype)
+        else:
+            columns[name] = np.memmap(filename, dtype=dtype, mode="r")
+    return columns
+
+
+def tracedGames(path, chunkRows=1000000):
+    # yield playGame records for the games in a trace, in order, reading
+    # about chunkRows rows at a time
+    c = readTrace(path)
+    turn = c["turn"]
+    n = len(turn)
+    start = 0
+    while start < n:
+        stop = start
+        starts = []
+        while stop < n and len(starts) < 2:
+            # usually once, unless a game is longer than a chunk
+            stop = min(stop + chunkRows, n)
+            starts = (np.nonzero(turn[start:stop] == 0)[0] + start).tolist()
+        if stop < n:
+            # the last game may carry on past stop
+            stop = starts.pop()
+        for a, b in zip(starts, starts[1:] + [stop]):
+            deltas = c["scoreDelta"][a:b].tolist()
+            yield (sum(deltas), b - a - 1, c["movesAvailable"][a:b].tolist(),
+                   c["chains"][a:b].tolist(), c["meanHeight"][a:b - 1].tolist(),
+                   c["move"][a:b - 1].tolist(), deltas)
+        start = stop
+
+
+def replayGame(pat, k):
+    # Replay game k of the traced run in directory pat, turn by turn: yield
+    # the board at each position, starting from the settled starting board,
+    # with the move played from it (None at the end).  The board is
+    # rebuilt from the run's seed and the moves in the trace, and checked
+    # against the trace as we go.  Games from the batch engine share their
+    # refills between games, so they can't be replayed.
+    with open(os.path.join(pat, "run.json")) as f:
+        run = json.load(f)
+    if run["engine"] == "batch":
+        raise ValueError("games played by the batch engine can't be replayed")
+    c = readTrace(os.path.join(pat, "trace"))
+    rows = np.nonzero(c["game"] == k)[0]
+    if len(rows) == 0:
+        raise ValueError("no game " + str(k) + " in the trace")
+    first, last = int(rows[0]), int(rows[-1]) + 1
+    b = board(run["width"], run["height"], run["numberOfColours"],
+              engine=run["engine"], rng=colourStream(run["seed"], k))
+    try:
+        b.randomize()
+        for t, row in enumerate(range(first, last)):
+            before = b.score
+            b.evolve()
+            moves, n = b.legitMoves()
+            if (n != c["movesAvailable"][row] or
+                    b.score - before != c["scoreDelta"][row]):
+                raise ValueError("game " + str(k) + " doesn't match its "
+                                 "trace at turn " + str(t))
+            code = int(c["move"][row])
+            if code < 0:
+                yield b, None
+                return
+            move = decodeMove(code, b.width)
+            yield b, move
+            b.applyMove(move)
+            b.numberOfTurns += 1
+    finally:
+        b.close()
+
+
+def traceStats(path):
+    # the gameStats of the games in a trace, e.g. to redo a run's report
+    # with statsAndPlots(traceStats(path))
+    stats = gameStats()
+    for game in tracedGames(path):
+        stats.addGame(game)
+    return stats
+
+
+def playGame(b, chooser, timings=None, packed=False, indexed=False,
+             opening=None):
+    # play one game on board b using chooser.  Return its score, its length,
+    # the number of moves available at each turn, the number of chain
+    # reactions caused by each move (the first entry is for the starting
+    # board), the mean height of the moves available at each turn but
+    # the last, the move played at each turn but the last (see
+    # encodeMove), and the points gained by each move (the first entry is
+    # for the starting board again).  If timings is a hotPathTimings, b and
+    # chooser are timed.
+    #
+    # With packed=True chooser is given the moves as a moveCodes, and
+    # returns a move code, so no lists are made for the moves at all.  With
+    # indexed=True, or if chooser has an attribute wantsIndex = True, it is
+    # given them as a moveIndex (of codes, if packed).
+    #
+    # opening is for a b that has been randomized and evolved already: the
+    # number of chain reactions and the points that evolve gave.
+    wantsBoard = getattr(chooser, "wantsBoard", False)
+    if packed and wantsBoard:
+        raise ValueError("choosers that need the board take lists of moves")
+    if wantsBoard and isinstance(b, tiledBoard):
+        raise ValueError("choosers that need the board can't use the tiled engine")
+    indexed = indexed or getattr(chooser, "wantsIndex", False)
+    rowLength = 2 * b.width
+    if timings is not None:
+        timings.instrument(b)
+        chooser = timings.timed("chooser", chooser)
+    if opening is None:
+        b.randomize()
+    movesAvailable = []
+    chains = []
+    meanHeights = []
+    movesPlayed = []
+    scoreDeltas = []
+    while True:
+        if opening is None:
+            before = b.score
+            chains.append(b.evolve())
+            scoreDeltas.append(b.score - before)
+        else:
+            chains.append(opening[0])
+            scoreDeltas.append(opening[1])
+            opening = None
+        if indexed:
+            moves = b.moveIndex(packed)
+            numberOfAvailableMoves = len(moves)
+        elif packed:
+            moves = b.legitMoveCodes()
+            numberOfAvailableMoves = len(moves)
+        else:
+            moves, numberOfAvailableMoves = b.legitMoves()
+        movesAvailable.append(numberOfAvailableMoves)
+        if numberOfAvailableMoves == 0:
+            return (b.score, b.numberOfTurns, movesAvailable, chains, meanHeights,
+                    movesPlayed, scoreDeltas)
+        # the return lets us assume numberOfAvailableMoves != 0
+        if indexed:
+            meanHeights.append(moves.meanHeight)
+        elif packed:
+            meanHeights.append(sum([c // rowLength for c in moves]) /
+                               (1.0 * numberOfAvailableMoves))
+        else:
+            meanHeights.append(sum([x[0][0] for x in moves]) /
+                               (1.0 * numberOfAvailableMoves))
+        if packed:
+            code = chooser(moves)
+            movesPlayed.append(code)
+            b.applyMoveCode(code)
+        else:
+            if wantsBoard:
+                move = chooser(moves, b)
+            else:
+                move = chooser(moves)
+            movesPlayed.append(encodeMove(move, b.width))
+            b.applyMove(move)
+        b.numberOfTurns += 1
+
+
+def gameSeed(seed, k):
+    # the seed for game (or batch) k of a run with the given seed: a hash,
+    # so nearby runs and games get unrelated random streams
+    return int(hashlib.md5(str(seed) + " " + str(k)).hexdigest()[:8], 16)
+
+
+def playGames(args):
+    # Play games first, first + 1, ..., last - 1 of a run, seeding game k
+    # (or, for the batch engine, the whole batch) from gameSeed(seed, k),
+    # and return their gameStats.  This is what the
+    # worker processes of testStrategy run, so chooser has to be picklable,
+    # i.e. a function defined at the top level of a module.  If instrument
+    # is True the stats carry a hotPathTimings, and if trace is True a
+    # traceBuffer of the games.  (The batch engine numbers its games in the
+    # order they finish.)  packed and indexed are passed on to playGame.
+    (chooser, first, last, seed, width, height, numberOfColours, engine,
+     instrument, trace, packed, indexed) = args
+    stats = gameStats()
+    if instrument:
+        stats.timings = hotPathTimings()
+    if trace:
+        stats.trace = traceBuffer()
+    if engine == "batch":
+        if indexed or getattr(chooser, "wantsIndex", False):
+            raise ValueError("the batch engine can't index moves")
+        random.seed(gameSeed(seed, first))
+        np.random.seed(gameSeed(seed, first))
+        if instrument:
+            chooser = stats.timings.timed("chooser", chooser)
+        games = playBatch(chooser, last - first, width, height,
+                          numberOfColours, batchSize=last - first,
+                          packed=packed)
+    else:
+        games = playSeededGames(chooser, first, last, seed, width, height,
+                                numberOfColours, engine, stats.timings, packed,
+                                indexed)
+    for k, game in enumerate(games, first):
+        stats.addGame(game)
+        if trace:
+            stats.trace.addGame(k, game)
+    return stats
+
+
+def playSeededGames(chooser, first, last, seed, width, height,
+                    numberOfColours, engine, timings, packed=False,
+                    indexed=False):
+    # the playGame records of games first, ..., last - 1 of a seeded run.
+    # Game k's board draws from colourStream(seed, k), and its chooser from
+    # the random module seeded with gameSeed(seed, k).
+    for k in range(first, last):
+        random.seed(gameSeed(seed, k))
+        b = board(width, height, numberOfColours, engine=engine,
+                  rng=colourStream(seed, k))
+        try:
+            game = playGame(b, chooser, timings, packed, indexed)
+        finally:
+            b.close()
+        yield game
+
+
+def chunkSize(engine):
+    # the number of games seededStats plays at a time
+    return 10000 if engine == "batch" else 100
+
+
+def seededStats(chooser, numberOfGames, width, height, numberOfColours,
+                engine, seed, processes, instrument=False, trace=False,
+                packed=False, indexed=False, first=0):
+    # play games first, ..., numberOfGames - 1 of a seeded run, sharing the
+    # work between processes worker processes, and yield the gameStats of
+    # each chunk of games in order.  The games are cut into chunks of a
+    # fixed size whatever the number of processes, so the merged results
+    # only depend on the seed (and, for the batch engine, on first being a
+    # multiple of the chunk size).
+    size = chunkSize(engine)
+    chunks = [(chooser, start, min(start + size, numberOfGames), seed,
+               width, height, numberOfColours, engine, instrument, trace,
+               packed, indexed)
+              for start in range(first, numberOfGames, size)]
+    if processes == 1:
+        for chunk in chunks:
+            yield playGames(chunk)
+        return
+    pool = multiprocessing.Pool(processes)
+    try:
+        for stats in pool.imap(playGames, chunks):
+            yield stats
+    finally:
+        pool.terminate()
+
+
+def testStrategy(chooser, numberOfGames, width=8, height=8, numberOfColours=7,
+                 engine="list", seed=None, processes=1, instrument=False,
+                 report="show", trace=True, packed=False, indexed=False,
+                 checkpointSeconds=60, resume=None):
     # a strategy is a way of choosing moves. testStrategy takes
     # a function `chooser' which accepts a list of moves and returns
     # one of them, and a number numberOfGames, and runs numberOfGames
     # games using chooser to pick from the available moves.
-    # It returns the list of scores from those games and the list of game
-    # lengths.
+    # (A chooser with an attribute wantsBoard = True is called as
+    # chooser(moves, b) with the board b as well, see lookaheadChooser.)
+    # It returns a gameStats holding the scores and lengths of those games,
+    # the deltas in the number of available moves for each possible number
+    # of available moves ("position"), the mean heights of the moves
+    # available by position, and so on; see gameStats.
     #
-    # Log the deltas for each possible number of
-    # available moves ("position"), and compare the distributions.
-    # deltasByPosition should be a defaultdict:
-    # deltasByPosition = defaultdict(list), then dbp[n].append(delta)
-    # keys = number n of moves available,
-    # deltasByPosition[n] = list of deltas for that number n of moves available
+    # engine picks the board implementation, see board.__new__, or is
+    # "batch" to play the games in lockstep on boardBatches.
     #
-    # meanHeights is a dict whose [n] value is a list. The list has one element
-    # for each time there were n moves available.  This element is the mean
-    # height of all the moves available at that time.
-    scores = []
-    lengths = []
-    deltaMovesAvailable = []
-    initialMovesAvailable = []
-    maxMovesAvailable = []
-    chains = []
-    allMovesAvailable = []
-    deltasByPosition = defaultdict(list)
-    meanHeightMovesAvailableByPosition = defaultdict(list)
-    for i in range(numberOfGames):
-        b = board(width, height, numberOfColours)
-        b.randomize()
-        movesAvailableThisGame = []
-        while True:
-            chains.append(b.evolve())
-            moves, numberOfAvailableMoves = b.legitMoves()
-            movesAvailableThisGame.append(numberOfAvailableMoves)
-            if numberOfAvailableMoves == 0:
-                scores.append(b.score)
-                lengths.append(b.numberOfTurns)
-                deltas = [movesAvailableThisGame[ii + 1] - movesAvailableThisGame[ii] for ii in range(len(movesAvailableThisGame) - 1)]
-                deltaMovesAvailable += deltas
-                for iii in range(len(movesAvailableThisGame) - 1):
-                    deltasByPosition[movesAvailableThisGame[iii]].append(deltas[iii])
-                initialMovesAvailable.append(movesAvailableThisGame[0])
-                maxMovesAvailable.append(max(movesAvailableThisGame))
-                allMovesAvailable += movesAvailableThisGame
-                break
-            # the break lets us assume numberOfAvailableMoves != 0
-            meanHeight = sum([x[0][0] for x in moves]) / (1.0 * numberOfAvailableMoves)
-            meanHeightMovesAvailableByPosition[numberOfAvailableMoves].append(meanHeight)
-            b.applyMove(chooser(moves))
-            b.numberOfTurns += 1
-
-    statsAndPlots(scores, lengths, deltaMovesAvailable, initialMovesAvailable,
-                  maxMovesAvailable, deltasByPosition, chains, allMovesAvailable, meanHeightMovesAvailableByPosition)
-
-
-def statsAndPlots(scores, lengths, deltaMovesAvailable, initialMovesAvailable,
-                  maxMovesAvailable, deltasByPosition, chains, allMovesAvailable, meanHeightMovesAvailableByPosition):
-    # Produce plots and statistics, write them to disk in a sensible manner
+    # Every game gets its own random streams derived from the run's seed
+    # (see playGames), so the results are the same for any number of
+    # processes, and any game can be replayed (see replayGame).  Without a
+    # seed the run picks one, and prints it.
+    #
+    # With instrument=True the stats also get a hotPathTimings saying where
+    # the time went, which statsAndPlots writes to timings.txt.  Otherwise
+    # nothing is timed and nothing costs any more.
+    #
+    # report says what to do with the statistics and plots: "show" writes
+    # them and shows each plot in a window, "headless" just writes them,
+    # "background" writes them from another process without waiting for
+    # it, and None skips them.
+    #
+    # With trace=True every turn of every game is written to a trace (see
+    # traceColumns) in the run's directory as the games finish, so the
+    # report can be redone later with statsAndPlots(traceStats(path)).
+    #
+    # With packed=True the moves are passed around as moveCodes rather than
+    # lists, see playGame; all the chooser functions below can take them.
+    # With indexed=True they come as a moveIndex instead, bucketed by row
+    # and with the points each move scores to hand.
+    #
+    # Every checkpointSeconds (None for never) the stats so far are saved
+    # to a checkpoint in the run's directory, with a progress.txt saying
+    # how far the run has got; the trace, if any, can be looked at with
+    # statsAndPlots(traceStats(path)) at any time.  A run that stops early
+    # can be carried on from its last checkpoint with resume set to its
+    # directory, which gives the same results as if it hadn't stopped.
+    # The settings come from the run.json there, so only chooser (which
+    # has to be the same one), processes, instrument, report and
+    # checkpointSeconds count; the rest are ignored.
+    start = time.time()
+    if resume is not None:
+        pat = resume
+        with open(os.path.join(pat, "run.json")) as f:
+            settings = json.load(f)
+        if settings["chooser"] != chooserName(chooser):
+            raise ValueError("the run in " + pat + " used " +
+                             settings["chooser"])
+        numberOfGames = settings["numberOfGames"]
+        width = settings["width"]
+        height = settings["height"]
+        numberOfColours = settings["numberOfColours"]
+        engine = settings["engine"]
+        seed = settings["seed"]
+        # (runs from before resuming was possible don't say)
+        trace = settings.get("trace", True)
+        packed = settings.get("packed", False)
+        indexed = settings.get("indexed", False)
+        stats, first, seconds = loadCheckpoint(pat)
+        start -= seconds
+        print("resuming " + pat + " after " + str(first) + " games")
+    else:
+        stats = gameStats()
+        first = 0
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+            print("seed " + str(seed))
+        pat = runDirectory() if report is not None or trace else None
+        if pat is not None:
+            # what replayGame and resuming need to know about the run
+            with open(os.path.join(pat, "run.json"), "w") as f:
+                json.dump({"chooser": chooserName(chooser),
+                           "numberOfGames": numberOfGames, "width": width,
+                           "height": height,
+                           "numberOfColours": numberOfColours,
+                           "engine": engine, "seed": seed, "trace": trace,
+                           "packed": packed, "indexed": indexed}, f,
+                          indent=1)
+    if pat is None:
+        checkpointSeconds = None
+    lastCheckpoint = time.time()
+    for chunkStats in seededStats(chooser, numberOfGames, width, height,
+                                  numberOfColours, engine, seed, processes,
+                                  instrument, trace, packed, indexed, first):
+        if trace:
+            chunkStats.trace.appendTo(os.path.join(pat, "trace"))
+        stats.merge(chunkStats)
+        first += chunkStats.lengths.count()
+        if (checkpointSeconds is not None and
+                time.time() - lastCheckpoint >= checkpointSeconds):
+            saveCheckpoint(pat, stats, first, numberOfGames,
+                           time.time() - start)
+            lastCheckpoint = time.time()
+    if checkpointSeconds is not None:
+        saveCheckpoint(pat, stats, first, numberOfGames, time.time() - start)
+    if stats.timings is not None:
+        stats.timings.wallSeconds = time.time() - start
+        stats.timings.games = stats.lengths.count()
+        stats.timings.turns = sum(k * c for k, c in stats.lengths.items())
+
+    if report == "background":
+        # the plots are drawn by another process while we get on with it;
+        # waitForReports() waits for them
+        p = multiprocessing.Process(target=statsAndPlots,
+                                    args=(stats, pat, False))
+        p.start()
+        reportProcesses.append(p)
+    elif report is not None:
+        statsAndPlots(stats, pat, show=(report == "show"))
+    return stats
+
+
+def saveCheckpoint(pat, stats, games, numberOfGames, seconds):
+    # Save the gameStats of the first games games of the run in directory
+    # pat, and how long they took, to its checkpoint, and say how the run
+    # is going in its progress.txt.  Game k of a run only depends on the
+    # seed and k, so that's all the random state there is to keep.  The
+    # checkpoint notes how long the trace is, so rows added after it can
+    # be dropped on resuming.
+    dump({"games": games, "seconds": seconds,
+          "traceRows": traceRows(os.path.join(pat, "trace")),
+          "stats": stats}, os.path.join(pat, "checkpoint"))
+    lines = [str(games) + " of " + str(numberOfGames) + " games played in " +
+             str(int(seconds)) + " seconds"]
+    if games:
+        lines.append("about " +
+                     str(int(seconds * (numberOfGames - games) / games)) +
+                     " seconds to go")
+        lines.append("mean score %.1f, sd %.1f, mean length %.1f" %
+                     (stats.scores.mean(), stats.scores.sd(),
+                      stats.lengths.mean()))
+    with open(os.path.join(pat, "progress.txt"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def dump(x, path):
+    # pickle x to path, by way of a temporary file so a crash while
+    # writing leaves what was there before
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        pickle.dump(x, f, pickle.HIGHEST_PROTOCOL)
+    os.rename(temporary, path)
+
+
+def loadCheckpoint(pat):
+    # the gameStats, number of games and seconds from the checkpoint of the
+    # run in directory pat, cutting its trace back to the games they cover
+    checkpointPath = os.path.join(pat, "checkpoint")
+    if os.path.exists(checkpointPath):
+        with open(checkpointPath, "rb") as f:
+            checkpoint = pickle.load(f)
+    else:
+        # stopped before the first checkpoint
+        checkpoint = {"games": 0, "seconds": 0.0, "traceRows": 0,
+                      "stats": gameStats()}
+    truncateTrace(os.path.join(pat, "trace"), checkpoint["traceRows"] or 0)
+    return checkpoint["stats"], checkpoint["games"], checkpoint["seconds"]
+
+
+def chooserName(chooser):
+    # a chooser function's name, or a chooser object's class name
+    return getattr(chooser, "__name__", type(chooser).__name__)
+
+
+def scoreDifference(a, b, z):
+    # the difference between the mean scores of gameStats a and b, and the
+    # half-width of the normal confidence interval for it with z standard
+    # errors each side
+    variance = (a.scores.sd() ** 2 / a.scores.count() +
+                b.scores.sd() ** 2 / b.scores.count())
+    return a.scores.mean() - b.scores.mean(), z * variance ** 0.5
+
+
+def compareStrategies(choosers, confidence=0.95, precision=None,
+                      batchSize=1000, maxGames=500000, width=8, height=8,
+                      numberOfColours=7, engine="list", seed=None,
+                      processes=1, packed=False, indexed=False):
+    # Play batches of batchSize more games with each of choosers, until
+    # every difference between their mean scores is resolved or each has
+    # played maxGames, and print what was found.  Return an OrderedDict of
+    # the gameStats of each chooser by name, and whether everything was
+    # resolved.
+    #
+    # Two choosers are told apart when the confidence interval for the
+    # difference of their mean scores excludes 0, and, if precision is
+    # given, count as just as good when it lies within +-precision.  Easy
+    # comparisons are resolved after a batch or two, hard ones take as
+    # many games as they need.
+    #
+    # Each batch is another look at the intervals, and stopping on the
+    # first look that goes our way would make them too optimistic.  So
+    # look k uses intervals with level 1 - alpha / (pairs * k * (k + 1)),
+    # where alpha = 1 - confidence: these add up so that the chance of any
+    # interval at any look missing is at most alpha.
+    #
+    # Every chooser plays the games of the same seeded run (see
+    # testStrategy), so the intervals, which treat the choosers' games as
+    # independent, are if anything too wide.  Nothing is written to disk.
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+        print("seed " + str(seed))
+    if engine == "batch":
+        # keep to whole chunks, see seededStats
+        size = chunkSize(engine)
+        batchSize = -(-batchSize // size) * size
+    names = [chooserName(c) for c in choosers]
+    stats = OrderedDict((name, gameStats()) for name in names)
+    pairs = [(a, b) for n, a in enumerate(names) for b in names[n + 1:]]
+    alpha = 1.0 - confidence
+    played = 0
+    look = 0
+    resolved = False
+    while played < maxGames and not resolved:
+        last = min(played + batchSize, maxGames)
+        for name, chooser in zip(names, choosers):
+            for chunkStats in seededStats(chooser, last, width, height,
+                                          numberOfColours, engine, seed,
+                                          processes, packed=packed,
+                                          indexed=indexed, first=played):
+                stats[name].merge(chunkStats)
+        played = last
+        look += 1
+        z = stat.norm.isf(alpha / (2.0 * len(pairs) * look * (look + 1)))
+        verdicts = []
+        for a, b in pairs:
+            difference, halfWidth = scoreDifference(stats[a], stats[b], z)
+            if abs(difference) > halfWidth:
+                verdict = "better" if difference > 0 else "worse"
+            elif precision is not None and abs(difference) + halfWidth <= precision:
+                verdict = "as good"
+            else:
+                verdict = None
+            verdicts.append((a, b, difference, halfWidth, verdict))
+        resolved = all(v[4] is not None for v in verdicts)
+
+    print(("resolved" if resolved else "unresolved") + " after " +
+          str(played) + " games each, " + str(played * len(names)) +
+          " in all")
+    for a, b, difference, halfWidth, verdict in verdicts:
+        print("%s - %s: %.1f +- %.1f %s" %
+              (a, b, difference, halfWidth, verdict or "unresolved"))
+    return stats, resolved
+
+
+def playTournamentGames(args):
+    # Play games first, ..., last - 1 of a seeded run with each of
+    # choosers, and return a list of the gameStats of each chooser's games
+    # and a list of an array of their scores.  Game k is dealt (randomized,
+    # evolved and scanned for moves) once and saved, and each chooser plays
+    # it from there as testStrategy would play game k of the run.
+    (choosers, first, last, seed, width, height, numberOfColours, engine,
+     packed, indexed) = args
+    stats = [gameStats() for c in choosers]
+    scores = [array("i") for c in choosers]
+    for k in range(first, last):
+        b = board(width, height, numberOfColours, engine=engine,
+                  rng=colourStream(seed, k))
+        try:
+            b.randomize()
+            opening = (b.evolve(), b.score)
+            b.refreshMoves()
+            start = b.saveState()
+            for n, chooser in enumerate(choosers):
+                if n > 0:
+                    b.restoreState(start)
+                random.seed(gameSeed(seed, k))
+                game = playGame(b, chooser, packed=packed, indexed=indexed,
+                                opening=opening)
+                stats[n].addGame(game)
+                scores[n].append(game[0])
+        finally:
+            b.close()
+    return stats, scores
+
+
+def tournament(choosers, numberOfGames, width=8, height=8, numberOfColours=7,
+               engine="list", seed=None, processes=1, packed=False,
+               indexed=False, confidence=0.95):
+    # Play the games of a seeded run with every one of choosers, and print
+    # each chooser's mean score and a table comparing each pair on the
+    # same games.  Return an OrderedDict of the gameStats of each chooser
+    # by name, and one of arrays of the scores of its games in order.
+    #
+    # Every chooser plays the same starting boards with the same refills
+    # (common random numbers), so each chooser's games are the ones
+    # testStrategy plays with the same seed, and a pair of choosers can be
+    # compared game by game.  When the differences in score on each game
+    # vary less than two independent runs' scores would, it takes fewer
+    # games to tell the choosers apart; the table says how many fewer.
+    # (On the 8x8 board games drift apart within a few moves, so don't
+    # expect much.)  Each game is dealt once for all the choosers, see
+    # playTournamentGames.  Nothing is written to disk.
+    if engine == "batch":
+        raise ValueError("the batch engine can't share games between "
+                         "choosers")
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+        print("seed " + str(seed))
+    names = [chooserName(c) for c in choosers]
+    stats = OrderedDict((name, gameStats()) for name in names)
+    scores = OrderedDict((name, array("i")) for name in names)
+    size = chunkSize(engine)
+    chunks = [(choosers, first, min(first + size, numberOfGames), seed, width,
+               height, numberOfColours, engine, packed, indexed)
+              for first in range(0, numberOfGames, size)]
+    if processes == 1:
+        results = (playTournamentGames(chunk) for chunk in chunks)
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap(playTournamentGames, chunks)
+    try:
+        for chunkStats, chunkScores in results:
+            for n, name in enumerate(names):
+                stats[name].merge(chunkStats[n])
+                scores[name].extend(chunkScores[n])
+    finally:
+        if processes != 1:
+            pool.terminate()
+    print(pairedTable(scores, confidence))
+    return stats, scores
+
+
+def pairedTable(scores, confidence=0.95):
+    # a table of the mean of each chooser's scores, given as an OrderedDict
+    # of arrays of the scores on the same games, and of the mean difference
+    # on each game for each pair with its confidence interval.  "x fewer"
+    # is how many times more games two independent runs would need for as
+    # narrow an interval.
+    z = stat.norm.isf((1.0 - confidence) / 2)
+    names = list(scores)
+    lines = ["%-20s %10s %10s" % ("chooser", "games", "mean")]
+    for name in names:
+        h = intHistogram(scores[name])
+        lines.append("%-20s %10d %10.1f" % (name, h.count(), h.mean()))
+    lines.append("")
+    lines.append("%-41s %10s %10s %10s" % ("pair", "difference", "+-",
+                                          "x fewer"))
+    for n, a in enumerate(names):
+        for b in names[n + 1:]:
+            differences = intHistogram(x - y for x, y in
+                                       zip(scores[a], scores[b]))
+            games = differences.count()
+            paired = differences.sd() ** 2 if games > 1 else float("nan")
+            independent = (intHistogram(scores[a]).sd() ** 2 +
+                           intHistogram(scores[b]).sd() ** 2)
+            lines.append("%-41s %10.1f %10.1f %10.1f" %
+                         (a + " - " + b, differences.mean(),
+                          z * (paired / games) ** 0.5,
+                          independent / paired if paired else float("inf")))
+    return "\n".join(lines)
+
+
+reportProcesses = []
+
+
+def waitForReports():
+    # wait for the reports testStrategy(..., report="background") started
+    while reportProcesses:
+        reportProcesses.pop().join()
+
+
+def runDirectory():
+    # create a subdirectory of where the script is, named with the current
+    # date and time, e.g. '2019-05-01T16:20:47' (ok as a unix directory
+    # name), and return its path
+    todayString = datetime.today().replace(microsecond=0).isoformat()
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    pat = os.path.join(cwd, todayString)
+    n = 1
+    while os.path.exists(pat):
+        # two runs in the same second
+        n += 1
+        pat = os.path.join(cwd, todayString + "-" + str(n))
+    os.mkdir(pat)
+    return pat
+
+
+def offscreen():
+    # make matplotlib draw into files only, never windows
+    if plt.module is None:
+        import matplotlib
+        matplotlib.use("Agg")
+    else:
+        plt.switch_backend("agg")
+
+
+def showPlot(show):
+    # after saving a figure: show it if asked to, and start a new one
+    if show:
+        plt.show()
+    plt.close()
+
+
+def histogram(h, **kwargs):
+    # plt.hist for an intHistogram: each value weighted by its count
+    values = sorted(h)
+    plt.hist(values, weights=[h[v] for v in values], **kwargs)
+
+
+def statsAndPlots(stats, pat=None, show=True):
+    # Produce plots and statistics for a gameStats, write them to disk in a
+    # sensible manner: to the directory pat, or a new runDirectory().  With
+    # show=False no windows are opened, so nothing waits for anyone to
+    # close them.
     #
-    # Note: scipy.stats.kurtosis produces the *excess* kurtosis by default
+    # Note: scipy.stats.kurtosis produces the *excess* kurtosis by default,
+    # and so do our describe() methods
+    if not show:
+        offscreen()
+    scores = stats.scores
+    lengths = stats.lengths
+    deltaMovesAvailable = stats.deltaMovesAvailable
+    initialMovesAvailable = stats.initialMovesAvailable
+    maxMovesAvailable = stats.maxMovesAvailable
+    deltasByPosition = stats.deltasByPosition
+    chains = stats.chains
+    allMovesAvailable = stats.allMovesAvailable
+    meanHeightMovesAvailableByPosition = stats.meanHeightMovesAvailableByPosition
 
     ##################################
     # create a directory for writing #
     ##################################
 
-    # create a subdirectory of where the script is running named with the
-    # current date and time
-    todayString = datetime.today().replace(microsecond=0).isoformat()
-    # e.g. '2019-05-01T16:20:47', ok as a unix directory name
-    os.mkdir(todayString)
-    cwd = os.path.dirname(os.path.abspath(__file__))
-    pat = os.path.join(cwd, todayString)
+    if pat is None:
+        pat = runDirectory()
     # now pat is the path to the directory in which we'll do our logging
     f = open(pat + "/stats.txt", "w+")
     # we'll log all stats to this file
@@ -299,30 +2488,31 @@ def statsAndPlots(scores, lengths, deltaMovesAvailable, initialMovesAvailable,
     # scores and lengths #
     ######################
 
-    plt.hist(scores, density=True, bins=70)
+    histogram(scores, density=True, bins=70)
     plt.title("scores density")
     plt.savefig(pat + "/scoresDensity.svg", format='svg')
-    plt.show()
+    showPlot(show)
 
-    op = "scores " + str(stat.describe(scores)) + "sd " + str(stat.tstd(scores))
+    op = "scores " + str(scores.describe()) + "sd " + repr(scores.sd())
     print op
     f.write(op + "\n")
 
-    plt.hist(lengths, density=True, bins=70)
+    histogram(lengths, density=True, bins=70)
     plt.title("lengths density")
     plt.savefig(pat + "/lengthsDensity.svg", format='svg')
-    plt.show()
+    showPlot(show)
 
-    op = "lengths " + str(stat.describe(lengths)) + "sd " + str(stat.tstd(lengths))
+    op = "lengths " + str(lengths.describe()) + "sd " + repr(lengths.sd())
     print(op)
     f.write(op + "\n")
 
-    plt.scatter(lengths, scores, s=1.5, marker=".")
+    plt.scatter([x[0] for x in stats.lengthsAndScores],
+                [x[1] for x in stats.lengthsAndScores], s=1.5, marker=".")
     plt.title("lengths vs scores")
-    plt.savefig(pat + "/lengthsVscores.svg", format='jpg')
-    plt.show()
+    plt.savefig(pat + "/lengthsVscores.svg", format='svg')
+    showPlot(show)
 
-    op = "sample corr coeff lengths-scores " + str(stat.pearsonr(lengths, scores))
+    op = "sample corr coeff lengths-scores " + str(stats.lengthScoreCorrelation())
     print op
     f.write(op + "\n")
 
@@ -339,8 +2529,8 @@ def statsAndPlots(scores, lengths, deltaMovesAvailable, initialMovesAvailable,
 
     for k in deltasByPosition.keys():
         positions.append(k)
-        expectedJumps.append(stat.tmean(deltasByPosition[k]))
-        descr = stat.describe(deltasByPosition[k])
+        expectedJumps.append(deltasByPosition[k].mean())
+        descr = deltasByPosition[k].describe()
         variances.append(descr.variance)
         kurtoses.append(descr.kurtosis)
         sds.append(descr.variance ** 0.5)
@@ -350,8 +2540,8 @@ def statsAndPlots(scores, lengths, deltaMovesAvailable, initialMovesAvailable,
         f.write(op + "\n")
 
     for k in [1, 4, 8, 12, 16]:  # dbp.keys():
-        n = len(deltasByPosition[k])
-        c = Counter(deltasByPosition[k])
+        n = deltasByPosition[k].count()
+        c = deltasByPosition[k]
         xvalues = sorted(c.keys())  # weird results for plotting lines unless
         # x-values sorted
         yvalues = [c[key] / (n * 1.0) for key in xvalues]
@@ -360,10 +2550,10 @@ def statsAndPlots(scores, lengths, deltaMovesAvailable, initialMovesAvailable,
     plt.legend()
     plt.title("available move deltas by position")
     plt.savefig(pat + "/move_deltas_by_position.svg", format='svg')
-    plt.show()
+    showPlot(show)
 
     for k in [1, 4, 8, 12, 16]:
-        c = Counter(deltasByPosition[k])
+        c = deltasByPosition[k]
         xvalues = sorted(c.keys())
         xtrunc = [x for x in xvalues if x >= -1]
         n = sum([c[key] for key in xtrunc])
@@ -373,40 +2563,40 @@ def statsAndPlots(scores, lengths, deltaMovesAvailable, initialMovesAvailable,
     plt.legend()
     plt.title("move deltas by position, ignoring steps <-1")
     plt.savefig(pat + "/conditional_move_deltas_by_position.svg", format='svg')
-    plt.show()
+    showPlot(show)
 
     plt.plot(positions, expectedJumps)
     plt.title("position - expected jump")
     plt.savefig(pat + "/position_vs_expected_jump.svg", format='svg')
-    plt.show()
+    showPlot(show)
 
     plt.plot(positions, variances)
     plt.title("position - variance of jumps")
     plt.savefig(pat + "/position_variance.svg", format='svg')
-    plt.show()
+    showPlot(show)
 
     plt.plot(positions, sds)
     plt.title("position - sd of jumps")
     plt.savefig(pat + "/position_sd.svg", format='svg')
-    plt.show()
+    showPlot(show)
 
     plt.plot(positions, kurtoses)
     plt.title("position - kurtosis")
     plt.savefig(pat + "/position_kurtosis.svg", format='svg')
-    plt.show()
+    showPlot(show)
 
     plt.plot(positions, skewnesses)
     plt.title("position - skewness")
     plt.savefig(pat + "/skewness.svg", format='svg')
-    plt.show()
+    showPlot(show)
 
-    plt.hist(deltaMovesAvailable, density=True, bins=range(min(deltaMovesAvailable) - 2, max(deltaMovesAvailable) + 2))
+    histogram(deltaMovesAvailable, density=True, bins=range(min(deltaMovesAvailable) - 2, max(deltaMovesAvailable) + 2))
     plt.title("available move deltas overall")
     plt.savefig(pat + "/available_move_deltas.svg", format='svg')
-    plt.show()
+    showPlot(show)
 
-    op = "deltas " + str(stat.describe(deltaMovesAvailable)) + " sd " + \
-        str(stat.tstd(deltaMovesAvailable))
+    op = "deltas " + str(deltaMovesAvailable.describe()) + " sd " + \
+        repr(deltaMovesAvailable.sd())
     print op
     f.write(op + '\n')
 
@@ -414,42 +2604,42 @@ def statsAndPlots(scores, lengths, deltaMovesAvailable, initialMovesAvailable,
     # initial, max, all numbers of moves available, chain reactions #
     #################################################################
 
-    plt.hist(initialMovesAvailable, density=True, bins=range(max(initialMovesAvailable) + 2))
+    histogram(initialMovesAvailable, density=True, bins=range(max(initialMovesAvailable) + 2))
     plt.title("initial number of moves available")
     plt.savefig(pat + "/initialMovesAvailable.svg", format='svg')
-    plt.show()
+    showPlot(show)
 
-    op = "initial moves" + str(stat.describe(initialMovesAvailable))
+    op = "initial moves" + str(initialMovesAvailable.describe())
     print op
     f.write(op + '\n')
 
-    plt.hist(maxMovesAvailable, bins=range(max(maxMovesAvailable) + 2))
+    histogram(maxMovesAvailable, bins=range(max(maxMovesAvailable) + 2))
     plt.title("max number moves available")
     plt.savefig(pat + "/maxMovesAvailable.svg", format='svg')
-    plt.show()
+    showPlot(show)
 
-    op = "max moves " + str(stat.describe(maxMovesAvailable))
+    op = "max moves " + str(maxMovesAvailable.describe())
     print op
     f.write(op + '\n')
 
-    plt.hist(chains, bins=range(max(chains) + 2), density=True, align="left")
+    histogram(chains, bins=range(max(chains) + 2), density=True, align="left")
     plt.title("number of chain reactions caused")
     plt.savefig(pat + "/chains.svg", format='svg')
-    plt.show()
+    showPlot(show)
 
-    averageChainReactions = sum(chains) * 1.0 / len(chains)
-    numberChainReactions = len([x for x in chains if x > 0])
-    proportionChainReactions = numberChainReactions * 1.0 / len(chains)
+    averageChainReactions = chains.mean()
+    numberChainReactions = sum(c for x, c in chains.items() if x > 0)
+    proportionChainReactions = numberChainReactions * 1.0 / chains.count()
     op = "avg no. chain reactions per move " + str(averageChainReactions) + \
          " proportion of moves causing a cr " + str(proportionChainReactions)
     print op
     f.write(op + '\n')
 
-    plt.hist(allMovesAvailable, bins=range(max(allMovesAvailable) + 2), density=True)
+    histogram(allMovesAvailable, bins=range(max(allMovesAvailable) + 2), density=True)
     plt.title("number of moves available")
     plt.savefig(pat + "/allMovesAvailable.svg", format='svg')
-    plt.show()
-    op = "moves avail " + str(stat.describe(allMovesAvailable))
+    showPlot(show)
+    op = "moves avail " + str(allMovesAvailable.describe())
     print op
     f.write(op + '\n')
 
@@ -459,36 +2649,312 @@ def statsAndPlots(scores, lengths, deltaMovesAvailable, initialMovesAvailable,
 
     means = []
     for k in meanHeightMovesAvailableByPosition.keys():
-        mn = stat.tmean(meanHeightMovesAvailableByPosition[k])
+        mn = meanHeightMovesAvailableByPosition[k].mean
         means.append(mn)
 
     plt.scatter(meanHeightMovesAvailableByPosition.keys(), means, s=1, marker=".")
     plt.title("x = number of moves avail, y = mean height of moves avail")
     plt.savefig(pat + "/heightMovesAvailByPosn.svg", format='svg')
-    plt.show()
+    showPlot(show)
 
     f.close()
 
-    ############
-    # Pickling #
-    ############
-
-    def pick(name, obj):
-        with open(pat + "/" + name + ".pkl", 'wb') as output:
-            pickle.dump(obj, output)
-    # save the available moves distribution for simulation
-    counts = Counter()
-    for d in deltaMovesAvailable:
-        counts[d] += 1
-    pick("deltacounter", counts)
-    pick("scores", scores)
-    pick("lengths", lengths)
-    pick("deltaMovesAvailable", deltaMovesAvailable)
-    pick("initials", initialMovesAvailable)
-    pick("maxes", maxMovesAvailable)
-    pick("deltas by posn", deltasByPosition)
-    pick("allMovesAvailable", allMovesAvailable)
-    pick("height by position", meanHeightMovesAvailableByPosition)
+    if stats.timings is not None:
+        with open(pat + "/timings.txt", "w") as f:
+            f.write(stats.timings.report() + "\n")
+
+
+##################
+# cached results #
+##################
+
+# Bump this when a change to the board, the random streams or the helpers
+# the choosers use changes how games play out, so results cached before
+# it aren't used.
+resultsVersion = 1
+
+# where cachedStats keeps its results
+resultsDirectory = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "results")
+
+
+def chooserIdentity(chooser):
+    # a string that changes whenever chooser might play differently: its
+    # name and source code, and for a chooser object the source of its
+    # class and its settings(), a dict of whatever it was made with
+    if inspect.isfunction(chooser):
+        return chooser.__name__ + "\n" + inspect.getsource(chooser)
+    if not hasattr(chooser, "settings"):
+        raise ValueError("can't tell what " + chooserName(chooser) +
+                         "'s games depend on; give it a settings() method")
+    settings = sorted((k, chooserIdentity(v) if callable(v) else v)
+                      for k, v in chooser.settings().items())
+    return (chooserName(chooser) + "\n" + inspect.getsource(type(chooser)) +
+            repr(settings))
+
+
+def cachedStats(chooser, numberOfGames, width=8, height=8, numberOfColours=7,
+                engine="list", seed=0, processes=1, packed=False,
+                indexed=False, directory=None):
+    # The gameStats of games 0, ..., numberOfGames - 1 of the seeded run
+    # testStrategy would play, and the path of the trace of those games
+    # (and maybe more), from a store of results in directory (by default
+    # resultsDirectory).
+    #
+    # Each entry in the store is a directory named by a hash of what the
+    # games depend on: resultsVersion, chooserIdentity(chooser), the board's
+    # size, colours and mono length, and the seed.  It holds the trace of
+    # the first so many games of the run and their gameStats.  Asking for
+    # no more games than an entry has costs nothing when it's all of them,
+    # or a read of the trace when it's fewer; asking for more plays just
+    # the missing games and adds them to the entry.  The list and bitboard
+    # engines play the same games, as do packed and indexed moves, so they
+    # share entries.
+    #
+    # Entries are locked while in use, so several processes can share a
+    # store.
+    import fcntl
+    if engine == "batch":
+        raise ValueError("the batch engine's games depend on how many "
+                         "are played at once, so can't be cached")
+    key = OrderedDict([("resultsVersion", resultsVersion),
+                       ("chooser", chooserIdentity(chooser)),
+                       ("width", width), ("height", height),
+                       ("numberOfColours", numberOfColours),
+                       # testStrategy always plays with monos of 3 or more
+                       ("vanishLength", 3), ("seed", seed)])
+    digest = hashlib.sha1(json.dumps(key, sort_keys=True)).hexdigest()
+    pat = os.path.join(directory or resultsDirectory, digest)
+    if not os.path.isdir(pat):
+        os.makedirs(pat)
+    tracePath = os.path.join(pat, "trace")
+    with open(os.path.join(pat, "lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        entryPath = os.path.join(pat, "entry.json")
+        if os.path.exists(entryPath):
+            with open(entryPath) as f:
+                entry = json.load(f)
+            with open(os.path.join(pat, "stats"), "rb") as f:
+                stats = pickle.load(f)
+        else:
+            entry = OrderedDict([("key", key), ("games", 0),
+                                 ("traceRows", 0)])
+            stats = gameStats()
+        # drop any rows an extension that died left behind
+        truncateTrace(tracePath, entry["traceRows"])
+        if entry["games"] < numberOfGames:
+            for chunkStats in seededStats(chooser, numberOfGames, width,
+                                          height, numberOfColours, engine,
+                                          seed, processes, trace=True,
+                                          packed=packed, indexed=indexed,
+                                          first=entry["games"]):
+                chunkStats.trace.appendTo(tracePath)
+                chunkStats.trace = None
+                stats.merge(chunkStats)
+            entry["games"] = numberOfGames
+            entry["traceRows"] = traceRows(tracePath)
+            dump(stats, os.path.join(pat, "stats"))
+            with open(entryPath, "w") as f:
+                json.dump(entry, f, indent=1)
+        elif entry["games"] > numberOfGames:
+            stats = gameStats()
+            for game in itertools.islice(tracedGames(tracePath),
+                                         numberOfGames):
+                stats.addGame(game)
+    return stats, tracePath
+
+
+####################
+# markov surrogate #
+####################
+
+class markovSurrogate(object):
+    # A model of games as a Markov chain in the number of moves available,
+    # fitted to traces, which plays games many times faster than a board.
+    #
+    # The state is the number of moves available, X.  Given X = x, the
+    # next turn's X, the points it scores and its chain reactions are drawn
+    # together from those seen after turns with x moves available in the
+    # traces, and a game ends when X is 0; the opening's X, points and
+    # chain reactions are drawn from the traces' openings.  That's the walk
+    # in the README's plots, plus the points and chain reactions.
+    #
+    # Everything else about the board is forgotten, so whether the games it
+    # plays look like the real ones is something to check, see
+    # validateSurrogate.
+    def __init__(self):
+        # Counters of (X, points, chains): for openings, and by the X of
+        # the turn before
+        self.openings = Counter()
+        self.transitions = defaultdict(Counter)
+        self.tables = None
+
+    def fit(self, path, chunkRows=10000000):
+        # add the turns in the trace in directory path, reading about
+        # chunkRows rows at a time, and return self
+        c = readTrace(path)
+        n = len(c["turn"])
+        for a in range(0, n, chunkRows):
+            b = min(a + chunkRows, n)
+            # rows a, ..., b - 1, and the row after for the last transition
+            rows = np.column_stack([c[name][a:b + 1].astype(np.int64)
+                                    for name in ("turn", "movesAvailable",
+                                                 "scoreDelta", "chains")])
+            starts = rows[:b - a, 0] == 0
+            for row, count in countRows(rows[:b - a][starts, 1:]):
+                self.openings[row] += count
+            carriesOn = rows[1:, 0] != 0
+            pairs = np.column_stack([rows[:-1][carriesOn, 1],
+                                     rows[1:][carriesOn, 1:]])
+            for row, count in countRows(pairs):
+                self.transitions[row[0]][row[1:]] += count
+        self.tables = None
+        return self
+
+    def makeTables(self):
+        # Alias tables (Walker, Vose) to draw outcomes from in constant
+        # time.  Each state x with transitions, and the openings, gets an
+        # ordinal o (the openings 0) and a block of size[o] entries from
+        # offset[o] in the flat arrays: entry j is its outcome, or with
+        # chance 1 - probability[j] that of entry alias[j].  An outcome is
+        # kept as the ordinal of its X (-1 if it's 0, the game being over),
+        # its points and its chain reactions.
+        states = sorted(self.transitions)
+        ordinals = dict((x, k) for k, x in enumerate(states, 1))
+        ordinals[0] = -1
+        blocks = [self.openings] + [self.transitions[x] for x in states]
+        outcomes = [key for block in blocks for key in sorted(block)]
+        for x, points, chains in outcomes:
+            if x not in ordinals:
+                raise ValueError("the traces never carry on from " + str(x) +
+                                 " moves available")
+        size = np.array([len(block) for block in blocks], dtype=np.int64)
+        offset = np.concatenate([[0], np.cumsum(size)[:-1]])
+        probability = np.ones(len(outcomes))
+        alias = np.arange(len(outcomes))
+        for block, start in zip(blocks, offset.tolist()):
+            keys = sorted(block)
+            total = float(sum(block.values()))
+            scaled = [block[key] * len(keys) / total for key in keys]
+            small = [k for k, q in enumerate(scaled) if q < 1.0]
+            large = [k for k, q in enumerate(scaled) if q >= 1.0]
+            while small and large:
+                k = small.pop()
+                l = large[-1]
+                probability[start + k] = scaled[k]
+                alias[start + k] = start + l
+                scaled[l] -= 1.0 - scaled[k]
+                if scaled[l] < 1.0:
+                    small.append(large.pop())
+            # what's left is 1 but for rounding
+        self.tables = (size, offset, probability, alias,
+                       np.array([ordinals[o[0]] for o in outcomes]),
+                       np.array([o[1] for o in outcomes], dtype=np.int64),
+                       np.array([o[2] for o in outcomes], dtype=np.int64))
+
+    def draw(self, blocks, rng):
+        # the index of an outcome drawn for each of blocks, an array of
+        # ordinals
+        size, offset, probability, alias = self.tables[:4]
+        u = rng.random_sample(len(blocks)) * size[blocks]
+        k = u.astype(np.int64)
+        j = offset[blocks] + k
+        return np.where(u - k < probability[j], j, alias[j])
+
+    def simulate(self, numberOfGames, seed=None, maxTurns=100000):
+        # play numberOfGames games and return their gameStats, which has
+        # the scores, lengths, lengthsAndScores, chains and
+        # initialMovesAvailable of the games (the rest would take keeping
+        # every turn).  Games still going after maxTurns turns stop there.
+        if not self.openings:
+            raise ValueError("fit the surrogate to a trace first")
+        if self.tables is None:
+            self.makeTables()
+        nextState, points, chainsOf = self.tables[4:]
+        rng = np.random.RandomState(seed)
+        first = self.draw(np.zeros(numberOfGames, dtype=np.int64), rng)
+        scores = points[first]
+        lengths = np.zeros(numberOfGames, dtype=np.int64)
+        # chain reaction counts are small, so count them with bincount
+        # (offset by one, as evolve gives -1 when there were no monos)
+        chains = np.bincount(chainsOf[first] + 1)
+        state = nextState[first]
+        playing = np.nonzero(state >= 0)[0]
+        state = state[playing]
+        turns = 0
+        while len(playing) and turns < maxTurns:
+            outcome = self.draw(state, rng)
+            scores[playing] += points[outcome]
+            lengths[playing] += 1
+            counts = np.bincount(chainsOf[outcome] + 1)
+            if len(counts) > len(chains):
+                counts, chains = chains, counts
+            chains[:len(counts)] += counts
+            state = nextState[outcome]
+            going = state >= 0
+            playing = playing[going]
+            state = state[going]
+            turns += 1
+        stats = gameStats()
+        initial = np.array([o[0] for o in sorted(self.openings)])[first]
+        for name, values in (("scores", scores), ("lengths", lengths),
+                             ("initialMovesAvailable", initial)):
+            for (v,), count in countRows(values[:, None]):
+                getattr(stats, name)[v] = count
+        for row, count in countRows(np.column_stack([lengths, scores])):
+            stats.lengthsAndScores[row] = count
+        for c, count in enumerate(chains.tolist(), -1):
+            if count:
+                stats.chains[c] = count
+        return stats
+
+
+def countRows(rows):
+    # (row as a tuple of ints, number of times it appears) for the distinct
+    # rows of a 2-d integer array
+    if len(rows) == 0:
+        return []
+    distinct, counts = np.unique(rows, axis=0, return_counts=True)
+    return [(tuple(r), c) for r, c in zip(distinct.tolist(), counts.tolist())]
+
+
+def validateSurrogate(chooser, numberOfGames, width=8, height=8,
+                      numberOfColours=7, engine="list", seed=0, processes=1,
+                      surrogateGames=1000000):
+    # Fit a markovSurrogate to numberOfGames full-board games of chooser
+    # from the run with the given seed, and print how the scores and
+    # lengths of surrogateGames of its games compare with those of
+    # numberOfGames other full-board games (from the run with seed + 1),
+    # and how fast it played them.  The full-board games come from
+    # cachedStats, so checking again costs little.  Return the surrogate.
+    #
+    # D is the largest gap between the cumulative distributions of the
+    # surrogate's games and the full-board ones, and p the chance of a gap
+    # that big if they came from the same distribution: a small p says the
+    # surrogate's games look detectably different from real ones at this
+    # many games.
+    fitStats, tracePath = cachedStats(chooser, numberOfGames, width, height,
+                                      numberOfColours, engine, seed,
+                                      processes)
+    surrogate = markovSurrogate().fit(tracePath)
+    real, realTrace = cachedStats(chooser, numberOfGames, width, height,
+                                  numberOfColours, engine, seed + 1, processes)
+    start = time.time()
+    simulated = surrogate.simulate(surrogateGames, seed)
+    seconds = time.time() - start
+    print("%d surrogate games in %.1f seconds, %.0f a second" %
+          (surrogateGames, seconds, surrogateGames / max(seconds, 1e-9)))
+    print("%-8s %-10s %8s %8s %6s %6s %6s" %
+          ("", "", "mean", "sd", "10%", "50%", "90%"))
+    for name in ("scores", "lengths"):
+        for label, stats in (("board", real), ("surrogate", simulated)):
+            h = getattr(stats, name)
+            print("%-8s %-10s %8.1f %8.1f %6d %6d %6d" %
+                  (name, label, h.mean(), h.sd(), h.quantile(0.1),
+                   h.quantile(0.5), h.quantile(0.9)))
+        d, p = ksTest(getattr(real, name), getattr(simulated, name))
+        print("%-8s D = %.4f, p = %.3g" % (name, d, p))
+    return surrogate
 
 
 ##########################
@@ -496,69 +2962,466 @@ def statsAndPlots(scores, lengths, deltaMovesAvailable, initialMovesAvailable,
 ##########################
 
 
+# The moves given to a chooser are lists of coordinates [[i, j], [k, l]],
+# or with testStrategy(..., packed=True) a moveCodes, and the chooser
+# returns one of them.  With testStrategy(..., indexed=True), or for a
+# chooser with an attribute wantsIndex = True, the moves come as a
+# moveIndex of either.  Those below take any of these, and use an index
+# to skip the sorting.
+
+
+def moveRow(moves):
+    # a function giving the row of each of moves
+    if isinstance(moves, moveIndex):
+        moves = moves.moves
+    if isinstance(moves, moveCodes):
+        rowLength = 2 * moves.width
+        return lambda code: code // rowLength
+    return lambda move: move[0][0]
+
+
+def sortedByRow(moves):
+    # moves in row order, keeping the order of moves within each row
+    if isinstance(moves, moveIndex):
+        return moves.moves
+    return sorted(moves, key=moveRow(moves))
+
+
+def highestMoves(moves):
+    # the moves in the highest row with any, in order
+    if isinstance(moves, moveIndex):
+        return moves.rows[moves.highestRow]
+    row = moveRow(moves)
+    movesSortedByRow = sorted(moves, key=row)
+    highestRowWithMoves = row(movesSortedByRow[0])
+    highest = [movesSortedByRow[0]]
+    for i in range(1, len(movesSortedByRow)):
+        if row(movesSortedByRow[i]) == highestRowWithMoves:
+            highest.append(movesSortedByRow[i])
+        else:
+            break
+    return highest
+
+
 def randomChooser(moves):
     return random.choice(moves)
 
 
 def chooseFromTop3(moves):
     # pick randomly from the 3 moves nearest the top
-    movesSortedByRow = sorted(moves, key=lambda x: x[0][0])
-    return random.choice(movesSortedByRow[:3])
+    return random.choice(sortedByRow(moves)[:3])
 
 
 def chooseFromTop2(moves):
     # pick randomly from the 2 moves nearest the top
-    movesSortedByRow = sorted(moves, key=lambda x: x[0][0])
-    return random.choice(movesSortedByRow[:2])
+    return random.choice(sortedByRow(moves)[:2])
 
 
 def chooseTop1(moves):
-    movesSortedByRow = sorted(moves, key=lambda x: x[0][0])
-    return movesSortedByRow[0]
+    return sortedByRow(moves)[0]
 
 
 def chooseFromHighest(moves):
     # pick randomly from the highest moves
-    movesSortedByRow = sorted(moves, key=lambda x: x[0][0])
-    highestRowWithMoves = movesSortedByRow[0][0][0]
-    highestMoves = [movesSortedByRow[0]]
-    for i in range(1, len(movesSortedByRow)):
-        if movesSortedByRow[i][0][0] == highestRowWithMoves:
-            highestMoves.append(movesSortedByRow[i])
-        else:
-            break
-    return random.choice(highestMoves)
+    return random.choice(highestMoves(moves))
 
 
 def chooseLastHighest(moves):
-    movesSortedByRow = sorted(moves, key=lambda x: x[0][0])
-    highestRowWithMoves = movesSortedByRow[0][0][0]
-    highestMoves = [movesSortedByRow[0]]
-    for i in range(1, len(movesSortedByRow)):
-        if movesSortedByRow[i][0][0] == highestRowWithMoves:
-            highestMoves.append(movesSortedByRow[i])
-        else:
-            break
-    return highestMoves[-1]
+    return highestMoves(moves)[-1]
 
 
 def chooseBottom3(moves):
     # pick randomly from the 3 moves nearest the bottom
-    movesSortedByRow = sorted(moves, key=lambda x: x[0][0])
-    return random.choice(movesSortedByRow[-3:])
+    return random.choice(sortedByRow(moves)[-3:])
 
 
 def chooseBottom1(moves):
     # pick randomly from the 3 moves nearest the bottom
-    movesSortedByRow = sorted(moves, key=lambda x: x[0][0])
-    return movesSortedByRow[-1]
+    return sortedByRow(moves)[-1]
+
+
+def chooseGreedy(moves):
+    # pick randomly from the moves scoring the most points straight away,
+    # not counting chain reactions
+    gains = moves.gains()
+    best = max(gains)
+    return random.choice([moves[n] for n in range(len(moves))
+                          if gains[n] == best])
+chooseGreedy.wantsIndex = True
+
+
+class budgetExceeded(Exception):
+    pass
+
+
+class lookaheadChooser(object):
+    # A chooser which looks ahead: it plays each move on the board with
+    # pushMove, samples the random refills, and scores the move by the
+    # points gained plus the expected value of the best move after it
+    # (expectimax), down to depth turns.  At the leaves a position is worth
+    # mobilityWeight per legal move, and a finished game costs
+    # gameOverPenalty.
+    #
+    # Searches deepen one turn at a time up to depth, and stop when
+    # maxNodes turns have been played or maxSeconds have passed, using the
+    # deepest search that finished.  Values of positions are kept in a
+    # transposition table keyed by the board's Zobrist hash and the depth,
+    # holding at most tableSize entries (least recently used ones go
+    # first).  Refills are drawn from our own random.Random seeded from the
+    # position, so a position's value doesn't depend on the game's random
+    # state and the table can be kept from move to move and game to game.
+    #
+    # Use an instance as the chooser in testStrategy, e.g.
+    # testStrategy(lookaheadChooser(depth=2, maxNodes=500), 1000)
+    wantsBoard = True
+
+    def __init__(self, depth=2, samples=2, maxNodes=None, maxSeconds=None,
+                 tableSize=100000, mobilityWeight=1.0, gameOverPenalty=100.0):
+        self.depth = depth
+        self.samples = samples
+        self.maxNodes = maxNodes
+        self.maxSeconds = maxSeconds
+        self.tableSize = tableSize
+        self.mobilityWeight = mobilityWeight
+        self.gameOverPenalty = gameOverPenalty
+        self.table = OrderedDict()
+        self.sampler = random.Random()
+        self.nodes = 0  # turns played in searches, in total
+        self.tableHits = 0
+
+    def settings(self):
+        # what we were made with, see chooserIdentity
+        return {"depth": self.depth, "samples": self.samples,
+                "maxNodes": self.maxNodes, "maxSeconds": self.maxSeconds,
+                "tableSize": self.tableSize,
+                "mobilityWeight": self.mobilityWeight,
+                "gameOverPenalty": self.gameOverPenalty}
+
+    def __call__(self, moves, b):
+        self.budgetNodes = self.nodes + self.maxNodes if self.maxNodes else None
+        self.deadline = time.time() + self.maxSeconds if self.maxSeconds else None
+        gameRng = b.rng
+        b.rng = self.sampler
+        best = moves[0]
+        try:
+            for depth in range(1, self.depth + 1):
+                values = [self.expectation(b, m, depth) for m in moves]
+                best = moves[values.index(max(values))]
+        except budgetExceeded:
+            pass
+        finally:
+            b.rng = gameRng
+        return best
+
+    def expectation(self, b, move, depth):
+        # the mean over the sampled refills of the points move gains plus
+        # the value of the position it leads to
+        total = 0.0
+        key = b.zobrist()
+        for s in range(self.samples):
+            self.nodes += 1
+            if self.budgetNodes is not None and self.nodes > self.budgetNodes:
+                raise budgetExceeded()
+            if self.deadline is not None and time.time() > self.deadline:
+                raise budgetExceeded()
+            self.sampler.seed(key ^ (s * 0x9e3779b97f4a7c15) ^ hash(tuple(move[0] + move[1])))
+            before = b.score
+            b.pushMove(move)
+            try:
+                total += b.score - before + self.value(b, depth - 1)
+            finally:
+                b.popMove()
+        return total / self.samples
+
+    def value(self, b, depth):
+        moves, n = b.legitMoves()
+        if n == 0:
+            return -self.gameOverPenalty
+        if depth == 0:
+            return self.mobilityWeight * n
+        key = (b.zobrist(), depth)
+        if key in self.table:
+            self.tableHits += 1
+            v = self.table.pop(key)
+            self.table[key] = v
+            return v
+        moves = list(moves)  # b.moveList is replaced as we search
+        v = max(self.expectation(b, m, depth) for m in moves)
+        self.table[key] = v
+        if len(self.table) > self.tableSize:
+            self.table.popitem(last=False)
+        return v
+
+
+def rollout(b, move, policy, seed, maxTurns):
+    # play move on b then up to maxTurns - 1 more moves picked by policy,
+    # take them all back, and return the points gained.  Both b.rng and the
+    # random module (which the choosers use) are seeded from seed.
+    b.rng.seed(seed)
+    random.seed(seed)
+    before = b.score
+    b.pushMove(move)
+    turns = 1
+    while turns < maxTurns:
+        moves, n = b.legitMoves()
+        if n == 0:
+            break
+        b.pushMove(policy(moves))
+        turns += 1
+    gain = b.score - before
+    for t in range(turns):
+        b.popMove()
+    return gain
+
+
+def rolloutGains(args):
+    # worker for rolloutChooser: rebuild the board from its entries and play
+    # one rollout per seed
+    entries, shape, move, policy, seeds, maxTurns = args
+    width, height, numberOfColours, vanishLength = shape
+    b = board(width, height, numberOfColours, vanishLength, rng=random.Random())
+    b.entries = [row[:] for row in entries]
+    b.invalidateMoves()
+    return [rollout(b, move, policy, seed, maxTurns) for seed in seeds]
+
+
+class rolloutChooser(object):
+    # A Monte Carlo chooser: each move is scored by the mean points gained
+    # over rollouts, which play the move then up to maxTurns - 1 moves
+    # picked by policy (any ordinary chooser).  The budget is spent by
+    # successive halving: every move gets an equal share of a round's
+    # rollouts, then the worse half are dropped, until one move is left.
+    # rollouts is the budget per decision; with maxSeconds as well we stop
+    # early when time runs out and pick the best move so far.
+    #
+    # With processes > 1 each round's rollouts are shared out over a pool
+    # of worker processes (then policy must be picklable).  rollouts and
+    # seconds count what was spent over all decisions; see report().
+    wantsBoard = True
+
+    def __init__(self, policy=randomChooser, rollouts=200, maxTurns=30,
+                 maxSeconds=None, processes=1, seed=0):
+        self.policy = policy
+        self.budget = rollouts
+        self.maxTurns = maxTurns
+        self.maxSeconds = maxSeconds
+        self.processes = processes
+        self.seed = seed
+        self.pool = None
+        self.rollouts = 0
+        self.seconds = 0.0
+        self.decisions = 0
+
+    def settings(self):
+        # what we were made with, see chooserIdentity
+        return {"policy": self.policy, "rollouts": self.budget,
+                "maxTurns": self.maxTurns, "maxSeconds": self.maxSeconds,
+                "seed": self.seed}
+
+    def __getstate__(self):
+        # a pool can't be pickled; a copy in another process makes its own
+        state = dict(self.__dict__)
+        state["pool"] = None
+        return state
+
+    def report(self):
+        return ("rollouts " + str(self.rollouts) + " in " +
+                str(round(self.seconds, 3)) + "s over " + str(self.decisions) +
+                " decisions, " + str(round(self.rolloutsPerSecond(), 1)) +
+                " rollouts/second")
+
+    def rolloutsPerSecond(self):
+        return self.rollouts / self.seconds if self.seconds else 0.0
+
+    def close(self):
+        # shut down the worker processes, if we started any
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+    def __call__(self, moves, b):
+        start = time.time()
+        deadline = start + self.maxSeconds if self.maxSeconds else None
+        gameRng = b.rng
+        globalState = random.getstate()
+        b.rng = random.Random()
+        arms = range(len(moves))
+        totals = [0.0] * len(moves)
+        counts = [0] * len(moves)
+        rounds = max(1, (len(moves) - 1).bit_length())
+        # seeded by the position, not by how many decisions we've made, so
+        # a game's rollouts don't depend on which games came before it
+        seedBase = (self.seed * 1000003 ^ b.zobrist() ^
+                    (b.score * 7919 + b.numberOfTurns) * 100000007)
+        processes = self.processes
+        if multiprocessing.current_process().daemon:
+            # testStrategy's workers can't start workers of their own
+            processes = 1
+        try:
+            while len(arms) > 1:
+                perArm = max(1, self.budget // (len(arms) * rounds))
+                jobs = [(a, [seedBase + a * 100003 + counts[a] + r
+                             for r in range(perArm)]) for a in arms]
+                if processes > 1:
+                    if self.pool is None:
+                        self.pool = multiprocessing.Pool(self.processes)
+                    shape = (b.width, b.height, b.numberOfColours, b.vanishLength)
+                    results = self.pool.map(rolloutGains, [
+                        (b.entries, shape, moves[a], self.policy, seeds,
+                         self.maxTurns) for a, seeds in jobs])
+                    for (a, seeds), gains in zip(jobs, results):
+                        totals[a] += sum(gains)
+                        counts[a] += len(gains)
+                else:
+                    for a, seeds in jobs:
+                        for seed in seeds:
+                            if deadline is not None and time.time() > deadline:
+                                raise budgetExceeded()
+                            totals[a] += rollout(b, moves[a], self.policy,
+                                                 seed, self.maxTurns)
+                            counts[a] += 1
+                if deadline is not None and time.time() > deadline:
+                    raise budgetExceeded()
+                arms = sorted(arms, key=lambda a: -totals[a] / counts[a])
+                arms = arms[:(len(arms) + 1) // 2]
+        except budgetExceeded:
+            tried = [a for a in range(len(moves)) if counts[a]]
+            if tried:
+                arms = [max(tried, key=lambda a: totals[a] / counts[a])]
+        finally:
+            b.rng = gameRng
+            random.setstate(globalState)
+            self.rollouts += sum(counts)
+            self.seconds += time.time() - start
+            self.decisions += 1
+        return moves[arms[0]]
 
 
 ##################################
 # run the test, plot the results #
 ##################################
 
-testStrategy(chooseBottom1, 5000, width=8, height=8, numberOfColours=8)
+# the choosers main() knows by name; classes are made with their defaults
+namedChoosers = dict((f.__name__, f) for f in [
+    randomChooser, chooseFromTop3, chooseFromTop2, chooseTop1,
+    chooseFromHighest, chooseLastHighest, chooseBottom3, chooseBottom1,
+    chooseGreedy, lookaheadChooser, rolloutChooser])
+
+
+def main(argv=None):
+    # e.g. python jewels.py chooseFromHighest --games 1000 --processes 4
+    parser = argparse.ArgumentParser(
+        description="play games of jewels with a strategy and report on them")
+    parser.add_argument("chooser", nargs="?", default="chooseBottom1",
+                        choices=sorted(namedChoosers))
+    parser.add_argument("--games", type=int, default=5000)
+    parser.add_argument("--width", type=int, default=8)
+    parser.add_argument("--height", type=int, default=8)
+    parser.add_argument("--colours", type=int, default=8)
+    parser.add_argument("--engine", default="list",
+                        choices=sorted(engines) + ["batch"])
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--instrument", action="store_true",
+                        help="record where the time goes in timings.txt")
+    parser.add_argument("--report", default="headless",
+                        choices=["show", "headless", "background", "none"],
+                        help="show the plots in windows, or only write them "
+                        "(default), maybe from a background process")
+    parser.add_argument("--packed", action="store_true",
+                        help="pass moves to the chooser as packed ints")
+    parser.add_argument("--indexed", action="store_true",
+                        help="pass moves to the chooser bucketed by row")
+    parser.add_argument("--no-trace", dest="trace", action="store_false",
+                        help="don't write a trace of every turn")
+    parser.add_argument("--compare", metavar="CHOOSER", action="append",
+                        choices=sorted(namedChoosers),
+                        help="play the chooser and CHOOSER (give more than "
+                        "once for more) until their mean scores are told "
+                        "apart, or --games each; nothing is written")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--precision", type=float,
+                        help="with --compare, count choosers whose mean "
+                        "scores are surely within this of each other as "
+                        "just as good")
+    parser.add_argument("--tournament", action="store_true",
+                        help="play the same --games games with every chooser "
+                        "function (or the chooser and the --compare choosers) "
+                        "and compare them game by game; nothing is written")
+    parser.add_argument("--cached", action="store_true",
+                        help="take the games from the store of results in "
+                        "results/ (seed 0 unless --seed), playing only those "
+                        "it hasn't got")
+    parser.add_argument("--surrogate", action="store_true",
+                        help="fit the Markov surrogate to --games cached "
+                        "games and compare its games with as many others")
+    parser.add_argument("--checkpoint", metavar="SECONDS", type=float,
+                        default=60,
+                        help="save the stats so far this often (default 60)")
+    parser.add_argument("--resume", metavar="DIR",
+                        help="carry on the run in DIR from its last "
+                        "checkpoint, with the settings it had")
+    parser.add_argument("--replot", metavar="DIR",
+                        help="play nothing, just redo the statistics and "
+                        "plots in DIR from its trace")
+    args = parser.parse_args(argv)
+    if args.replot:
+        statsAndPlots(traceStats(os.path.join(args.replot, "trace")),
+                      args.replot, show=(args.report == "show"))
+        return
+    if args.resume:
+        with open(os.path.join(args.resume, "run.json")) as f:
+            args.chooser = json.load(f)["chooser"]
+    chooser = namedChoosers[args.chooser]
+    if isinstance(chooser, type):
+        chooser = chooser()
+    if args.tournament and not args.compare:
+        choosers = [c for name, c in sorted(namedChoosers.items())
+                    if not isinstance(c, type)]
+    elif args.compare:
+        others = [namedChoosers[name] for name in args.compare]
+        choosers = [chooser] + [c() if isinstance(c, type) else c
+                                for c in others]
+    if args.tournament:
+        tournament(choosers, args.games, args.width, args.height,
+                   args.colours, engine=args.engine, seed=args.seed,
+                   processes=args.processes, packed=args.packed,
+                   indexed=args.indexed, confidence=args.confidence)
+        return
+    if args.surrogate:
+        validateSurrogate(chooser, args.games, args.width, args.height,
+                          args.colours, engine=args.engine,
+                          seed=args.seed or 0, processes=args.processes)
+        return
+    if args.cached:
+        stats, tracePath = cachedStats(
+            chooser, args.games, args.width, args.height, args.colours,
+            engine=args.engine, seed=args.seed or 0,
+            processes=args.processes, packed=args.packed,
+            indexed=args.indexed)
+        print("trace " + tracePath)
+        if args.report != "none":
+            statsAndPlots(stats, runDirectory(), show=(args.report == "show"))
+        return
+    if args.compare:
+        compareStrategies(choosers, args.confidence, args.precision,
+                          maxGames=args.games, width=args.width,
+                          height=args.height, numberOfColours=args.colours,
+                          engine=args.engine, seed=args.seed,
+                          processes=args.processes, packed=args.packed,
+                          indexed=args.indexed)
+        return
+    testStrategy(chooser, args.games, args.width, args.height, args.colours,
+                 engine=args.engine, seed=args.seed, processes=args.processes,
+                 instrument=args.instrument,
+                 report=None if args.report == "none" else args.report,
+                 trace=args.trace, packed=args.packed, indexed=args.indexed,
+                 checkpointSeconds=args.checkpoint, resume=args.resume)
+    waitForReports()
+
+
+if __name__ == "__main__":
+    main()
 
 
 # # export scores data in R-readable format
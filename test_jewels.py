@@ -0,0 +1,97 @@
+# checks that the engines play exactly the same games, and that pushMove
+# and popMove put a board back as it was
+#
+# python -m unittest test_jewels
+
+import random
+import unittest
+
+from jewels import board, colourStream
+
+# (width, height, numberOfColours, vanishLength)
+cases = [(8, 8, 7, 3), (13, 9, 5, 3), (17, 11, 4, 4)]
+
+# the engines to check against the list engine, with their options
+engines = [("bitboard", {}), ("tiled", {"processes": 1}),
+           ("tiled", {"processes": 3})]
+
+
+def entries(b):
+    return [list(row) for row in b.entries]
+
+
+def play(b, turns, packed, seed):
+    # a record of a seeded game of at most turns turns on b: the chain
+    # reactions, score, legal moves and monos at each turn, and the final
+    # entries
+    random.seed(seed)
+    record = []
+    b.randomize()
+    for t in range(turns):
+        record.append((b.evolve(), b.score, entries(b)))
+        if packed:
+            moves = list(b.legitMoveCodes())
+        else:
+            moves = b.legitMoves()[0]
+        record.append(moves)
+        if not moves:
+            break
+        record.append(b.findMonos())
+        move = random.choice(moves)
+        if packed:
+            b.applyMoveCode(move)
+        else:
+            b.applyMove(move)
+    record.append(entries(b))
+    return record
+
+
+def makeBoard(case, engine, k, **options):
+    width, height, numberOfColours, vanishLength = case
+    return board(width, height, numberOfColours, vanishLength, engine=engine,
+                 rng=colourStream(9, k), **options)
+
+
+class enginesTest(unittest.TestCase):
+
+    def test_same_games(self):
+        for case in cases:
+            for k, packed in enumerate([False, True]):
+                expected = play(makeBoard(case, "list", k), 40, packed, k)
+                for engine, options in engines:
+                    b = makeBoard(case, engine, k, **options)
+                    try:
+                        self.assertEqual(play(b, 40, packed, k), expected,
+                                         (case, engine, options, packed))
+                    finally:
+                        b.close()
+
+
+class moveStackTest(unittest.TestCase):
+
+    def test_push_pop(self):
+        for case in cases:
+            for engine, options in [("list", {})] + engines:
+                b = makeBoard(case, engine, 0, **options)
+                try:
+                    b.randomize()
+                    b.evolve()
+                    before = (entries(b), b.score, b.numberOfTurns,
+                              b.legitMoves()[0])
+                    random.seed(1)
+                    for t in range(5):
+                        moves = b.legitMoves()[0]
+                        if not moves:
+                            break
+                        b.pushMove(random.choice(moves))
+                    while b.moveStack:
+                        b.popMove()
+                    self.assertEqual((entries(b), b.score, b.numberOfTurns,
+                                      b.legitMoves()[0]), before,
+                                     (case, engine, options))
+                finally:
+                    b.close()
+
+
+if __name__ == "__main__":
+    unittest.main()